@@ -1,8 +1,6 @@
 import os
 from datetime import datetime
 
-from groq import Groq
-import google.generativeai as genai
 import json
 import random
 
@@ -10,13 +8,25 @@ import random
 # import llm_db
 
 import SASConnect
+import catalog_db
+import catalog_store
+import confirm_parser
+import intent_classifier
+import llm_cache
+import llm_clients
+import prompt_templates
+from context_window import ContextWindow
+from message_store import MessageStore, render
 import llm_db
+import slot_matcher
 
 # from main import user_details
 # from main import user_details
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# "loop": one LLM call per slot; "batch": one structured LLM call for all open slots
+SLOT_EXTRACTION_MODE = os.getenv("SLOT_EXTRACTION_MODE", "loop")
 
 
 class _GeminiChatCompletions:
@@ -36,32 +46,91 @@ class _GeminiChatCompletions:
         def __init__(self, content):
             self.choices = [self._ChoiceWrapper(content)]
 
-    def __init__(self, model):
+    class _ChunkWrapper:
+        """
+        One streamed piece of a response, shaped like an OpenAI/Groq stream chunk (.choices[0].delta.content).
+        """
+        class _ChoiceWrapper:
+            def __init__(self, content):
+                self.delta = _GeminiChatCompletions._ResultWrapper._MsgWrapper(content)
+
+        def __init__(self, content):
+            self.choices = [self._ChoiceWrapper(content)]
+
+    def __init__(self, model, model_name=""):
         self.model = model
+        self.model_name = model_name
 
-    def create(self, messages, model=None, response_format=None):
-        prompt = "\n".join([f"{m['role'].upper()}: {m['content']}" for m in messages])
+    def create(self, messages, model=None, response_format=None, stream=False, prefix=""):
+        """
+        :param prefix: stable prompt prefix sent ahead of the messages
+        """
+        # Each message record caches its rendered line, so this is only a join
+        prompt = "\n".join(render(m) for m in messages)
 
         # Guide Gemini to return JSON when requested
         if response_format and response_format.get("type") in {"json_object", "json_schema"}:
             system_hint = "Return JSON only, no extra text."
             prompt = f"{system_hint}\n{prompt}"
 
-        resp = self.model.generate_content(prompt)
+        if prefix:
+            prompt = f"{prefix}\n{prompt}"
+
+        # Shared model and channel (llm_clients); the provider's concurrency limit applies across all chatbots
+        limiter = llm_clients.limiter("gemini")
+        options = llm_clients.request_options()
+        if stream:
+            return self._stream(limiter.call(self.model.generate_content, prompt, stream=True, request_options=options))
+        resp = limiter.call(self.model.generate_content, prompt, request_options=options)
         content = resp.text if hasattr(resp, "text") else str(resp)
         return self._ResultWrapper(content)
 
+    def _stream(self, response):
+        for chunk in response:
+            try:
+                content = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only safety ratings or a finish reason)
+                continue
+            if content:
+                yield self._ChunkWrapper(content)
+
 
 class GeminiClient:
     """
     Adapter exposing .chat.completions.create to align with existing code paths.
+    One adapter per chatbot; the model underneath is shared.
     """
     def __init__(self, api_key, model_name="gemini-1.5-flash"):
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY is required")
-        genai.configure(api_key=api_key)
-        self._model = genai.GenerativeModel(model_name)
-        self.chat = type("chat", (), {"completions": _GeminiChatCompletions(self._model)})
+        self._model = llm_clients.gemini_model(api_key, model_name)
+        self.chat = type("chat", (), {"completions": _GeminiChatCompletions(self._model, model_name)})
+
+
+def format_option(key, row):
+    """
+    Format a catalog row the way fetch_info presents it to the LLM
+    """
+    if key == "Endpoint":
+        return {"Endpoint": row['param'], "Endpoint Code": row['paramcd']}
+    elif key == "CovarianceMatrix":
+        return row
+    return {"Variable Name": row['variable_name'], "Variable Label": row['variable_label']}
+
+
+def parse_json_response(content):
+    """
+    Parse a JSON object from an LLM response, tolerating markdown code fences
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
 
 
 def convert(string):
@@ -78,11 +147,16 @@ class BiostatChatbot:
     ## Constructor ##
     ##-------------##
 
-    def __init__(self, api_key, model_name, user_name):
+    def __init__(self, api_key, model_name, user_name, extraction_mode=None, session_id=None):
         self.api_key = api_key
         self.model_name = model_name
-        if model_name == "llama3-70b-8192":
-            self.llm = Groq(api_key=GROQ_API_KEY)
+        self.extraction_mode = extraction_mode or SLOT_EXTRACTION_MODE
+        # Clients are shared process-wide (llm_clients); only the Gemini adapter is per chatbot
+        provider = llm_clients.provider(model_name)
+        if provider == "mock":
+            self.llm = llm_clients.mock_client()
+        elif provider == "groq":
+            self.llm = llm_clients.groq_client(GROQ_API_KEY)
         else:
             # default to Gemini
             self.llm = GeminiClient(api_key=GEMINI_API_KEY, model_name=model_name)
@@ -97,13 +171,19 @@ class BiostatChatbot:
         # TODO Remove local database connection and update with online version in the future
         # llm_db.create_session()
         self.user_name = user_name
-        self.chat_history = [system_prompt]
+        self.chat_history = MessageStore([system_prompt])
+        self.context_window = ContextWindow()
         self.analysis_detail = None
         self.analysis_schema = None
         self.analysis_schema_info = None
         self.info_complete = False
         self.confirm_proceed = False
-        self.session_id = self.get_session()
+        self.job_id = None
+        # The user's latest message; chat_history only holds the prompts built from it
+        self.last_input = ""
+        self.session_id = session_id or self.get_session()
+        # Per-request callback receiving reply tokens as they are generated (set by the streaming endpoint)
+        self.token_sink = None
 
     ##-------------------##
     ## Utility Functions ##
@@ -166,6 +246,38 @@ class BiostatChatbot:
             f.write(role.title() + ":\n" + content + "\n\n")
 
 
+    def snapshot(self):
+        """
+        Serializable session state, used to park evicted sessions
+        """
+        return {
+            "user_name": self.user_name,
+            "session_id": self.session_id,
+            "chat_history": self.chat_history.as_dicts(),
+            "analysis_detail": self.analysis_detail,
+            "analysis_schema": self.analysis_schema,
+            "analysis_schema_info": self.analysis_schema_info,
+            "info_complete": self.info_complete,
+            "confirm_proceed": self.confirm_proceed,
+            "job_id": self.job_id,
+            "last_input": self.last_input,
+        }
+
+    def restore(self, state):
+        """
+        Restore session state produced by snapshot()
+        """
+        self.user_name = state["user_name"]
+        self.session_id = state["session_id"]
+        self.chat_history = MessageStore(state["chat_history"])
+        self.analysis_detail = state["analysis_detail"]
+        self.analysis_schema = state["analysis_schema"]
+        self.analysis_schema_info = state["analysis_schema_info"]
+        self.info_complete = state["info_complete"]
+        self.confirm_proceed = state["confirm_proceed"]
+        self.job_id = state.get("job_id")
+        self.last_input = state.get("last_input", "")
+
     def print_analysis_info(self):
         """
         Print the analysis details
@@ -179,79 +291,167 @@ class BiostatChatbot:
         """
         Add chat history
         """
-        self.chat_history.append({"role": role, "content": content})
+        self.chat_history.append(role, content)
 
 
     ##-----------------------------------------##
     ## LLM Connection & Conversation Functions ##
     ##-----------------------------------------##
 
-    def llm_text(self, prompt):
+    def llm_messages(self):
         """
-        Ask LLM specific prompt and get text response.
+        Bounded view of the chat history sent to the LLM; the full history is still kept for the logs.
+        The Gemini adapter takes the message records directly; other clients get plain dicts.
         """
+        messages = self.context_window.build(self.chat_history, self.analysis_detail)
+        if isinstance(self.llm, GeminiClient):
+            return messages
+        return [m.as_dict() for m in messages]
 
+    def stable_prefix(self, prefix=""):
+        """
+        The prompt's own prefix behind the current analysis schema. The schema text set_analysis renders stays
+        out of the chat history, so it is sent with every request of the analysis instead.
+        """
+        if self.analysis_detail is None:
+            return prefix
+        schema = prompt_templates.TEMPLATES["set_analysis"].prefix(analysis_name=self.get_method())
+        if not prefix or prefix == schema:
+            return schema
+        return f"{schema}\n{prefix}"
+
+    def llm_create(self, prefix="", **kwargs):
+        """
+        Send the chat history with the stable prompt prefix (see stable_prefix): the Gemini adapter puts it in
+        front of the prompt; other clients get it as a system message right after the system prompt, ahead of
+        everything that changes.
+        """
+        prefix = self.stable_prefix(prefix)
+        messages = self.llm_messages()
+        if isinstance(self.llm, GeminiClient):
+            return self.llm.chat.completions.create(messages=messages, model=self.model_name, prefix=prefix, **kwargs)
+        if prefix:
+            n_system = 0
+            while n_system < len(self.chat_history) and self.chat_history[n_system]["role"] == "system":
+                n_system += 1
+            messages.insert(n_system, {"role": "system", "content": prefix})
+        return self.llm.chat.completions.create(messages=messages, model=self.model_name, **kwargs)
+
+    def add_prompt(self, prompt):
+        """
+        Record a prompt (str or prompt_templates.Prompt) and return its stable prefix. Only the per-turn
+        suffix enters the chat history; the log gets the whole prompt.
+        """
+        if isinstance(prompt, prompt_templates.Prompt):
+            prefix, content = prompt.prefix, prompt.suffix or f"[{prompt.template}]"
+        else:
+            prefix, content = "", prompt
         # Append the user input to the chat history
-        self.add_chat_history("user", prompt)
+        self.add_chat_history("user", content)
         # TODO Remove local database connection and update with online version in the future
-        self.save_chat("user", prompt)
+        self.save_chat("user", str(prompt))
+        return prefix
 
-        chat_completion = self.llm.chat.completions.create(
-            messages=self.chat_history,
-            model=self.model_name,
-            response_format={"type": "text"},
-        )
+    def llm_cache_key(self, cache):
+        """
+        Response cache key for a (template ID, template inputs) pair, or None when caching is off
+        """
+        if cache is None or not llm_cache.ENABLED:
+            return None
+        template, inputs = cache
+        if self.analysis_detail is not None:
+            # The analysis schema is part of the prompt (stable_prefix)
+            inputs = dict(inputs, analysis=self.get_method())
+        return llm_cache.key(self.model_name, template, inputs)
+
+    def llm_text(self, prompt, stream=False, cache=None):
+        """
+        Ask LLM specific prompt and get text response.
+
+        :param prompt: prompt text or a rendered prompt_templates.Prompt
+        :param stream: forward the reply to `token_sink` piece by piece while it is generated
+        :param cache: (template ID, inputs) of a deterministic prompt; the reply is served from llm_cache when known
+        """
+        prefix = self.add_prompt(prompt)
+
+        cache_key = self.llm_cache_key(cache)
+        content = llm_cache.get(cache_key) if cache_key else None
+        if content is None:
+            if stream and self.token_sink is not None:
+                content = self.llm_stream(prefix)
+            else:
+                chat_completion = self.llm_create(
+                    prefix,
+                    response_format={"type": "text"},
+                )
+                content = chat_completion.choices[0].message.content
+            if cache_key:
+                llm_cache.put(cache_key, content, cache[0])
 
         # Append the response to the chat history
-        self.chat_history.append(
-            {"role": "assistant", "content": chat_completion.choices[0].message.content}
-        )
         # TODO Remove local database connection and update with online version in the future
-        self.add_chat_history("assistant", chat_completion.choices[0].message.content)
-        self.save_chat("assistant", chat_completion.choices[0].message.content)
+        self.add_chat_history("assistant", content)
+        self.save_chat("assistant", content)
 
-        return chat_completion.choices[0].message.content
+        return content
 
+    def llm_stream(self, prefix=""):
+        """
+        Stream a text completion of the current history to `token_sink` and return the full text.
+        """
+        parts = []
+        for chunk in self.llm_create(
+            prefix,
+            response_format={"type": "text"},
+            stream=True,
+        ):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                self.token_sink(delta)
+        return "".join(parts)
 
-    def llm_json(self, prompt):
+
+    def llm_json(self, prompt, schema=None, cache=None):
         """
         Ask LLM specific prompt and get JSON response.
-        """
 
-        # Append the user input to the chat history
-        self.add_chat_history("user", prompt)
-        # TODO Remove local database connection and update with online version in the future
-        self.save_chat("user", prompt)
-
-        if self.model_name == "llama3-70b-8192":
-            chat_completion = self.llm.chat.completions.create(
-                messages=self.chat_history,
-                model=self.model_name,
-                response_format={"type": "json_object"},
-            )
-        else:
-            chat_completion = self.llm.chat.completions.create(
-                messages=self.chat_history,
-                model=self.model_name,
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "AnalysisDetails",
-                        "schema": self.analysis_schema,
-                        "strict": True
+        :param prompt: prompt text or a rendered prompt_templates.Prompt
+        :param schema: JSON schema of the response (defaults to the current analysis schema)
+        :param cache: (template ID, inputs) of a deterministic prompt; the reply is served from llm_cache when known
+        """
+        prefix = self.add_prompt(prompt)
+
+        cache_key = self.llm_cache_key(cache)
+        content = llm_cache.get(cache_key) if cache_key else None
+        if content is None:
+            if self.model_name == "llama3-70b-8192":
+                chat_completion = self.llm_create(
+                    prefix,
+                    response_format={"type": "json_object"},
+                )
+            else:
+                chat_completion = self.llm_create(
+                    prefix,
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": {
+                            "name": "AnalysisDetails",
+                            "schema": schema or self.analysis_schema,
+                            "strict": True
+                        }
                     }
-                }
-            )
+                )
+            content = chat_completion.choices[0].message.content
+            if cache_key:
+                llm_cache.put(cache_key, content, cache[0])
 
         # Append the response to the chat history
-        self.chat_history.append(
-            {"role": "assistant", "content": chat_completion.choices[0].message.content}
-        )
         # TODO Remove local database connection
-        self.add_chat_history("assistant", chat_completion.choices[0].message.content)
-        self.save_chat("assistant", chat_completion.choices[0].message.content)
+        self.add_chat_history("assistant", content)
+        self.save_chat("assistant", content)
 
-        return chat_completion.choices[0].message.content
+        return content
 
 
     def ask_for_info(self, ask_for):
@@ -260,41 +460,21 @@ class BiostatChatbot:
         """
         if len(ask_for):
             # when parameter list is not complete
-            first_prompt = (f"Below are some things to ask the user for in a conversational and natural way. \n"
-                            f"First you should confirm current input by referring to schema: {self.analysis_detail}.\n"
-                            f"Please show all current input in bullet points. Please don't show unspecified parameters.\n"
-                            f"Second you should ask the user more information.\n"
-                            f"You should only ask one question at a time even if you don't get all the info "
-                            f"don't ask as a list! \nDon't greet the user! \nDon't say Hi. \n"
-                            f"Explain you need to get some info from the user to run the analysis. \n"
-                            f"Please provide list of options in bullet points if available. \n"
-                            f"It should be shown in the format of '<variable_name>: <variable_label>' or '<paramcd>: <param>'\n"
-                            f"Please show <variable_name> and <paramcd> as bold.\n"
-                            f"Don't repeat that you need get info from the user. \n"
-                            f"If the ask_for list is empty then thank them and ask how you can help them \n\n"
-                            f"### ask_for list: {ask_for[0]}")
+            first_prompt = prompt_templates.render(
+                "ask_for_info", analysis_detail=self.analysis_detail, key=ask_for[0],
+                options=self.top_options(ask_for[0], self.last_user_input()))
 
             # define `info_gathering_chain`: LLM Chain to collect information through the AI chat
-            ai_chat = self.llm_text(prompt=first_prompt)
+            ai_chat = self.llm_text(prompt=first_prompt, stream=True)
         else:
             if self.confirm_proceed:
-                complete_prompt = (f"Below are some things to talk to the user for in a conversational and natural way. \n"
-                                f"You have collected all the info and the user has confirmed to proceed."
-                                f"Don't ask as a list! \nDon't greet the user! \nDon't say Hi. \n"
-                                f"Please tell the user we are running SAS programs to perform the analysis. \n")
+                complete_prompt = prompt_templates.render("run_analysis")
             else:
                 # when parameter list is complete
-                complete_prompt = (f"Below are some things to talk to the user for in a conversational and natural way. \n"
-                                f"You have collected all the info."
-                                f"Don't ask as a list! \nDon't greet the user! \nDon't say Hi. \n"
-                                f"Explain you have collected all info needed from the user to run the analysis. \n"
-                                f"And ask the user to review these parameters and update these parameters if needed. \n"
-                                f"If no updates needed, we need user's confirmation to proceed. \n"
-                                f"Ask user to reply 'Yes' if confirm to proceed, and reply 'No' if there's update needed. \n"
-                                f"Please return a readable list for current parameter list: {self.analysis_detail}.")
+                complete_prompt = prompt_templates.render("confirm_info", analysis_detail=self.analysis_detail)
 
             # define `info_gathering_chain`: LLM Chain to collect information through the AI chat
-            ai_chat = self.llm_text(prompt=complete_prompt)
+            ai_chat = self.llm_text(prompt=complete_prompt, stream=True)
 
         # TODO Remove local database connection and update with online version in the future
         # self.add_chat_history("Biostat Chatbot", ai_chat)
@@ -314,40 +494,25 @@ class BiostatChatbot:
         # TODO Remove local database connection and update with online version in the future
         # self.add_chat_history(self.user_name, user_input)
         self.save_chat(self.user_name, user_input)
-        with open("schema/standard_analysis_schema.json", "r") as f:
-            standard_analysis_schema = json.load(f)
+        self.last_input = user_input
 
-        macro_names = set()
-        for analysis in standard_analysis_schema:
-            macro_names.add(analysis["AnalysisMethod"])
+        # Local keyword match first; only ambiguous or unmatched requests go to the LLM
+        fast_method = intent_classifier.classify(user_input)
+        if fast_method is not None:
+            self.save_chat("Intent Classifier", fast_method)
+            return fast_method
 
-        # Append the user input to the chat history
-        prompt = (f"Here is the list of available analysis: {macro_names}.\n"
-                  f"Please refer to following detailed description: {standard_analysis_schema}\n"
-                  f"Based on user's input: {user_input} \n"
-                  f"Which (if any) of the available analysis is the user requesting?\n"
-                  f"Return only the 'AnalysisMethod' of the analysis, no other description.\n"
-                  f"If the requested analysis is not in the list, return a value of 0.")
+        prompt = prompt_templates.render("find_stat_method", user_input=user_input)
 
-        return self.llm_text(prompt)
+        return self.llm_text(prompt, cache=("find_stat_method", {
+            "user_input": user_input, "catalog": catalog_store.digest("standard_analysis_schema.json")}))
 
 
     def set_analysis(self, analysis_name):
         """
         Set the analysis detail according to the analysis name
         """
-        if analysis_name == 'ANCOVA':
-            with open("schema/ancova1_analysis_schema.json", "r") as f:
-                analysis_schema = json.load(f)
-        elif analysis_name == 'BINARY':
-            with open("schema/binary1_analysis_schema.json", "r") as f:
-                analysis_schema = json.load(f)
-        elif analysis_name == 'TTE':
-            with open("schema/tte1_analysis_schema.json", "r") as f:
-                analysis_schema = json.load(f)
-        else:
-            with open("schema/mmrm1_analysis_schema.json", "r") as f:
-                analysis_schema = json.load(f)
+        analysis_schema = catalog_store.load(prompt_templates.analysis_schema_file(analysis_name))
 
         self.analysis_schema_info = analysis_schema
 
@@ -362,10 +527,7 @@ class BiostatChatbot:
         self.analysis_schema = schema
         self.analysis_detail = detail
 
-        prompt = (
-            f"According to user's request, we will run a {analysis_name} analysis. \n"
-            f"Please refer to following schema for detailed descriptions: {analysis_schema}."
-        )
+        prompt = prompt_templates.render("set_analysis", analysis_name=analysis_name)
 
         return self.llm_text(prompt)
 
@@ -404,18 +566,69 @@ class BiostatChatbot:
             ## TEXT Response from LLM ##
             ##------------------------##
             # refactor to ask LLM to return text instead of JSON schema
-            eval_prompt = (f"The user requested the following:\n{text_input}\n"
-                           f"Here is the list of available {key}\n"
-                           f"{self.fetch_info(key)}\n"
-                           f"Which (if any) of the available {key} is the user requesting?\n"
-                           f"Return only the paramcd or variable_name value for the {key}.\n"
-                           f"If the requested option is not in the list, return a value of 0."
-            )
+            new_value, options = self.match_info(key, text_input)
+            if new_value is not None:
+                new_detail['Parameters'][key] = new_value
+                continue
+
+            eval_prompt = prompt_templates.render("evaluate_info_loop", key=key, text_input=text_input, options=options)
 
-            new_value = self.llm_text(prompt=eval_prompt)
+            new_value = self.llm_text(prompt=eval_prompt, cache=("evaluate_info_loop", {
+                "key": key, "text_input": text_input, "options": options})).strip()
 
             # add details to schema programmatically (instead of LLM)
-            if new_value != '0':
+            if new_value not in ('0', ''):
+                new_detail['Parameters'][key] = new_value
+
+        return new_detail
+
+
+    def evaluate_info_batch(self, text_input, ask_for=None):
+        """
+        Collect all open parameters with a single structured LLM call.
+
+        Parameters resolved by the local matcher are filled first; the remaining ones are requested together
+        using the analysis schema restricted to those keys. Values of catalog parameters are validated against the
+        catalog; parameters without a catalog (e.g. CIMethod) take the returned value as is, like evaluate_info_loop.
+        """
+        if ask_for is None:
+            ask_for = self.get_param()
+
+        new_detail = self.analysis_detail
+
+        open_keys = []
+        options = {}
+        for key in ask_for:
+            new_value, key_options = self.match_info(key, text_input)
+            if new_value is not None:
+                new_detail['Parameters'][key] = new_value
+            else:
+                open_keys.append(key)
+                options[key] = key_options
+
+        if not open_keys:
+            return new_detail
+
+        schema = {
+            "type": "object",
+            "properties": {key: self.analysis_schema['properties'][key] for key in open_keys},
+            "required": open_keys,
+            "additionalProperties": False,
+        }
+        eval_prompt = prompt_templates.render("evaluate_info_batch", keys=open_keys, text_input=text_input,
+                                              options=options)
+
+        values = parse_json_response(self.llm_json(prompt=eval_prompt, schema=schema, cache=(
+            "evaluate_info_batch", {"keys": open_keys, "text_input": text_input, "options": options})))
+
+        for key in open_keys:
+            new_value = str(values.get(key, '0')).strip()
+            if self.has_catalog(key):
+                # keep only values that pass the same catalog check as check_info
+                new_value = self.resolve_info(key, new_value)
+            elif new_value in ('0', ''):
+                new_value = None
+            if new_value is not None:
                 new_detail['Parameters'][key] = new_value
 
         return new_detail
@@ -439,10 +652,14 @@ class BiostatChatbot:
         # TODO Remove local database connection and update with online version in the future
         # self.add_chat_history(self.user_name, text_input)
         self.save_chat(self.user_name, text_input)
+        self.last_input = text_input
 
         # Decide whether to use loop or not based on parameter
         if initial_input:
-            new_detail = self.evaluate_info_loop(text_input, ask_for = self.get_param())
+            if self.extraction_mode == "loop":
+                new_detail = self.evaluate_info_loop(text_input, ask_for = self.get_param())
+            else:
+                new_detail = self.evaluate_info_batch(text_input, ask_for = self.get_param())
         else:
             # new_detail = self.evaluate_info(text_input)
             self.evaluate_info(text_input)
@@ -497,22 +714,20 @@ class BiostatChatbot:
             ##------------------------##
             ## TEXT Response from LLM ##
             ##------------------------##
-            eval_prompt = (f"The user requested the following:\n{text_input}\n"
-                           f"Here is the list of available {key}\n"
-                           f"{self.fetch_info(key)}\n"
-                           f"Which (if any) of the available {key} is the user requesting?\n"
-                           f"Return only the Endpoint Code or Variable Name value for the {key}.\n"
-                           f"If the requested option is not in the list, return a value of 0."
-            )
-
-            new_value = self.llm_text(prompt=eval_prompt)
+            new_value, options = self.match_info(key, text_input)
+            if new_value is None:
+                eval_prompt = prompt_templates.render("evaluate_info", key=key, text_input=text_input, options=options)
+
+                new_value = self.llm_text(prompt=eval_prompt, cache=("evaluate_info", {
+                    "key": key, "text_input": text_input, "options": options}))
             print(f"New Value: {new_value}")
 
             # add details to schema programmingly (instead of LLM)
             # if new_value != '0':
-            if self.check_info(key, new_value):
+            new_value = self.resolve_info(key, new_value)
+            if new_value is not None:
                 print("New value existed!")
-                # add to Analysis Details only if the check_info returns True
+                # add to Analysis Details only if the value is in the catalog
                 self.analysis_detail['Parameters'][key] = new_value
             else:
                 # TODO ask LLM to run it again (maybe 3 times)
@@ -540,77 +755,111 @@ class BiostatChatbot:
 
         return self.analysis_detail
 
+    def match_info(self, key, text_input):
+        """
+        Match the user's input against the catalog locally before asking the LLM.
+
+        :return: (value, None) when one candidate clearly wins, else (None, options) where options are
+                 the top candidates when there are any, or the top search-index matches (see top_options)
+        """
+        match = slot_matcher.match(key, text_input)
+        if match.value is not None:
+            print(f"Local match for {key}: {match.value}")
+            return match.value, None
+        if match.candidates:
+            return None, [format_option(key, c.row) for c in match.candidates]
+        return None, self.top_options(key, text_input)
+
+    def top_options(self, key, text_input):
+        """
+        Catalog options for `key` ranked against the user's text by the search index; when nothing matches,
+        the first page from fetch_info plus a "more available" hint if the list is longer
+        """
+        name = catalog_db.PARAM_CATALOGS.get(key.lower())
+        if name is not None and text_input:
+            rows = catalog_db.rank(name, text_input)
+            if rows:
+                return [format_option(key, row) for row in rows]
+        options = self.fetch_info(key, limit=catalog_db.PAGE_SIZE)
+        more = self.count_info(key) - len(options)
+        if more > 0:
+            options.append(f"... {more} more available; ask the user to describe the value to narrow the list")
+        return options
+
+    def last_user_input(self):
+        """
+        The most recent user message, or "" if there is none
+        """
+        return self.last_input
+
+    def has_catalog(self, key):
+        """
+        Whether the allowed values of a parameter come from a catalog (and can be checked with resolve_info)
+        """
+        return key == "CovarianceMatrix" or key.lower() in catalog_db.PARAM_CATALOGS
+
     def check_info(self, key, value):
         """
         Check if the output value is from the list
         """
-        if value == '0':
-            return False
+        return self.resolve_info(key, value) is not None
+
+    def resolve_info(self, key, value):
+        """
+        Return the catalog code matching the value (case/whitespace-insensitive), or None if not in the list
+        """
+        if value is None or value.strip() == '0':
+            return None
 
         if key == "Endpoint":
-            for val in self.fetch_info(key):
-                if val['Endpoint Code'] == value:
-                    return True
+            row = catalog_db.lookup(key, value)
+            return row['paramcd'] if row else None
         elif key == 'Population' or key == 'Covariate' or key == 'ResponseVariable':
-            for val in self.fetch_info(key):
-                if val['Variable Name'] == value:
-                    return True
+            row = catalog_db.lookup(key, value)
+            return row['variable_name'] if row else None
         elif key == 'CovarianceMatrix':
-            for val in self.fetch_info(key):
-                if val['Structure'] == value:
-                    return True
+            wanted = catalog_store.normalize(value)
+            for row in self.covariance_options():
+                if catalog_store.normalize(row['Structure']) == wanted:
+                    return row['Structure']
+            return None
         else:
             for val in self.fetch_info(key):
                 if val == value:
-                    return True
-        return False
+                    return val
+        return None
 
-    def fetch_info(self, ask_for):
+    def fetch_info(self, ask_for, limit=None, offset=0):
         """
-        Fetch parameter/variable information
+        Fetch parameter/variable information (one page of `limit` options from `offset` when limit is given)
         """
         print(self.analysis_schema)
-        if ask_for == "Endpoint":
-            with open("schema/dataset_endpoint_schema.json", "r") as f:
-                dataset_ept_schema = json.load(f)
-                param_lst = []
-                for i in range(len(dataset_ept_schema)):
-                    param_lst.append({"Endpoint": dataset_ept_schema[i]['param'], "Endpoint Code": dataset_ept_schema[i]['paramcd']})
-        elif ask_for == "Population":
-            # TODO can we only include population variable
-            # with open("dataset_variable_schema.json", "r") as f:
-            with open("schema/dataset_population_schema.json", "r") as f:
-                # param_lst = json.load(f)
-                dataset_pop_schema = json.load(f)
-                param_lst = []
-                for i in range(len(dataset_pop_schema)):
-                    param_lst.append(
-                        {"Variable Name": dataset_pop_schema[i]['variable_name'], "Variable Label": dataset_pop_schema[i]['variable_label']})
-        elif ask_for == "ResponseVariable":
-            # param_lst = self.analysis_schema_info['properties']['Parameters']['ResponseVariable']['ValidValues']
-            with open("schema/dataset_rspvar_schema.json", "r") as f:
-                # param_lst = json.load(f)
-                dataset_rspvar_schema = json.load(f)
-                param_lst = []
-                for i in range(len(dataset_rspvar_schema)):
-                    param_lst.append(
-                        {"Variable Name": dataset_rspvar_schema[i]['variable_name'],
-                         "Variable Label": dataset_rspvar_schema[i]['variable_label']})
-        elif ask_for == "CovarianceMatrix":
-            param_lst = self.analysis_schema_info['properties']['Parameters']['CovarianceMatrix']['ValidValues']
-        elif ask_for == "Covariate":
-            # TODO can we only include covariate variable
-            # with open("dataset_variable_schema.json", "r") as f:
-            with open("schema/dataset_covariate_schema.json", "r") as f:
-                # param_lst = json.load(f)
-                dataset_covar_schema = json.load(f)
-                param_lst = []
-                for i in range(len(dataset_covar_schema)):
-                    param_lst.append(
-                        {"Variable Name": dataset_covar_schema[i]['variable_name'],
-                         "Variable Label": dataset_covar_schema[i]['variable_label']})
+        if ask_for == "CovarianceMatrix":
+            param_lst = self.covariance_options()
+            return param_lst[offset:] if limit is None else param_lst[offset:offset + limit]
+        name = catalog_db.PARAM_CATALOGS.get(ask_for.lower())
+        if name is None:
+            return []
+        fields = ("param", "paramcd") if ask_for == "Endpoint" else ("variable_name", "variable_label")
+        rows = catalog_db.rows(name, fields, limit=limit, offset=offset)
         # print(f"Valid Values of '{ask_for}' is {param_lst}.")
-        return param_lst
+        return [format_option(ask_for, row) for row in rows]
+
+    def count_info(self, ask_for):
+        """
+        Number of options available for a parameter
+        """
+        if ask_for == "CovarianceMatrix":
+            return len(self.covariance_options())
+        name = catalog_db.PARAM_CATALOGS.get(ask_for.lower())
+        return catalog_db.count(name) if name is not None else 0
+
+    def covariance_options(self):
+        """
+        Covariance structures allowed by the current analysis schema (empty when it has none)
+        """
+        parameters = (self.analysis_schema_info or {}).get('properties', {}).get('Parameters', {})
+        return parameters.get('CovarianceMatrix', {}).get('ValidValues', [])
 
     def check_what_is_empty(self):
         """
@@ -687,39 +936,35 @@ class BiostatChatbot:
         # TODO Remove local database connection and update with online version in the future
         # self.add_chat_history(self.user_name, text_input)
         self.save_chat(self.user_name, text_input)
+        self.last_input = text_input
 
-        # when the information status is complete, user will need to confirm to proceed or update current schema
-        eval_prompt = (f"The user requested the following:\n{text_input}\n"
-                       f"\nHere is the list of parameters that can be updated:\n"
-                       f"{self.get_param()}"
-                       f"\nIs the user confirming to execute the analysis or is the user asking to update a parameter?\n"
-                       f"\nReturn a value of 1 if the user is confirming and would like to execute the analysis.\n"
-                       f"\nIf the user would like to update a parameter(s), what parameter(s) would the user like to update? Only return the name of the parameter(s).\n"
-                       f"\nElse return a value of 0")
+        # when the information status is complete, user will need to confirm to proceed or update current schema;
+        # most replies ("yes", "no, change the population to ITT") are decided locally
+        reply = confirm_parser.parse(text_input, self.get_param())
+        if reply is None:
+            reply = self.classify_confirmation(text_input)
+        print(reply)
 
-        resp = self.llm_text(prompt=eval_prompt)
-        print(resp)
-
-        if resp == "1":
+        user_details = self.analysis_detail
+        ask_for = []
+        if reply.intent == confirm_parser.CONFIRM:
             self.confirm_proceed = True
-            user_details = self.analysis_detail
             self.analysis_detail["UserID"] = 'songgu.xie'
             self.analysis_detail["SessionID"] = self.session_id
             self.analysis_detail["DateTime"] = datetime.now()
             self.analysis_detail["Confirm"] = 'true'
-            ask_for = []
-        elif resp == "0":
-            # TODO ask user again for clarification
-            pass
-        else:
-            # TODO need to turn resp (parameters to update) to a list
-            print(resp)
-            ask_for = convert(resp)
-            new_detail = self.evaluate_info_loop(text_input, ask_for)
-
-            res = json.loads(new_detail)
-            user_details = self.add_new_details(res)
-            ask_for = []
+        elif reply.intent == confirm_parser.UPDATE:
+            unresolved = []
+            for key, value in reply.updates.items():
+                value = self.resolve_info(key, value)
+                if value is not None:
+                    self.analysis_detail['Parameters'][key] = value
+                else:
+                    unresolved.append(key)
+            if unresolved:
+                # evaluate_info_loop updates self.analysis_detail in place
+                self.evaluate_info_loop(text_input, unresolved)
+        # else: declined without naming a parameter; ask_for_info asks the user to confirm again
 
         # add collected info to the AnalysisDetails class
         # if self.info_complete and json.loads(new_detail) == self.analysis_detail:
@@ -733,6 +978,23 @@ class BiostatChatbot:
 
         return user_details, ask_for
 
+    def classify_confirmation(self, text_input):
+        """
+        LLM fallback for replies confirm_parser cannot decide: 1 (confirm), 0, or the parameter names to update
+        """
+        eval_prompt = prompt_templates.render("update_info", text_input=text_input, params=self.get_param())
+
+        resp = self.llm_text(prompt=eval_prompt, cache=("update_info", {
+            "text_input": text_input, "params": self.get_param()})).strip().strip("`'\".")
+        if resp == "1":
+            return confirm_parser.Confirmation(confirm_parser.CONFIRM, {})
+        params = {param.lower(): param for param in self.get_param()}
+        keys = [params[name.strip().lower()] for name in convert(resp) if name.strip().lower() in params]
+        if keys:
+            return confirm_parser.Confirmation(confirm_parser.UPDATE, {key: None for key in keys})
+        # "0" or anything unrecognised: ask again
+        return confirm_parser.Confirmation(confirm_parser.DECLINE, {})
+
     ##--------------------------##
     ## Step 5: Execute Analysis ##
     ##--------------------------##
@@ -749,16 +1011,49 @@ class BiostatChatbot:
 
         return aws_url
 
+    def reset_analysis(self):
+        """
+        Forget the current analysis and its job so the next message starts a new one
+        """
+        self.analysis_detail = None
+        self.analysis_schema = None
+        self.analysis_schema_info = None
+        self.info_complete = False
+        self.confirm_proceed = False
+        self.job_id = None
+
     def present_output(self, aws_url):
         """
         User should be notified that the output is ready, and can be retrieved at a certain location
         """
         # TODO Present URL to users
         response = f"Analysis successfully completed! The output can be found at [Link]({aws_url})"
-        self.chat_history.append({"role": "assistant", "content": response})
+        self.add_chat_history("assistant", response)
         self.output_chat_history()
         return response
 
+    def present_job(self, job):
+        """
+        Tell the user where a queued SAS job stands (`job` is None when it is no longer in the queue);
+        once it has finished, present its output
+        """
+        if job is None:
+            response = (f"The submitted analysis (job `{self.job_id}`) is no longer in the job queue. "
+                        f"Please request the analysis again.")
+        elif job["status"] == "succeeded":
+            return self.present_output(job["result_url"])
+        elif job["status"] == "failed":
+            response = f"The analysis failed to run in SAS: {job['error']}"
+        elif job["status"] == "running":
+            response = (f"Your analysis is running in SAS (job `{job['job_id']}`). "
+                        f"You can check on it at [/jobs/{job['job_id']}](/jobs/{job['job_id']}).")
+        else:
+            response = (f"Your analysis has been queued (job `{job['job_id']}`, {job.get('position', 0)} ahead of it). "
+                        f"You can check on it at [/jobs/{job['job_id']}](/jobs/{job['job_id']}).")
+        self.add_chat_history("assistant", response)
+        self.save_chat("Biostat Chatbot", response)
+        return response
+
     ##-----------------------------------------##
     ## Functions Under Development or Obsolete ##
     ##-----------------------------------------##
@@ -768,8 +1063,7 @@ class BiostatChatbot:
         Identify the intent of the user (TEMP)
         """
         # TODO update the prompt to include a full list of intents
-        with open("schema/standard_analysis_schema.json", "r") as f:
-            intent_list = json.load(f)
+        intent_list = catalog_store.load("standard_analysis_schema.json")
 
         prompt = (
             f"Based on user's input: {user_input} \n"
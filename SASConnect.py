@@ -1,16 +1,52 @@
-import saspy
 import os
-import json
+import tempfile
+import uuid
+
+import catalog_db
+import catalog_refresh
+import catalog_store
+import result_cache
+import sas_pool
+import sas_program
+from sas_program import SASProgram, call
 
 # import boto3
 # import logging
 # from botocore.exceptions import ClientError
 
-sas = saspy.SASsession()
+SRC_PATH = "/home/u50452179/src"
+ADS_PATH = "/home/u50452179/data"
+
+_BULK_MARKER = "BIOSTAT_BULK"
+
+# "bulk": all metadata tables in one delimited download; "dataframe": one saspy to_df() per table
+METADATA_TRANSFER = os.getenv("SAS_METADATA_TRANSFER", "bulk")
+
+# Preload every analysis macro (plus the upload macro and data library) when a SAS session is opened
+PRELOAD_MACROS = os.getenv("SAS_PRELOAD_MACROS", "1") == "1"
+
+# Dataset -> modification stamp seen by the last analysis or stamp check in this process
+_data_stamps = {}
+
+
+def warm_up(sas):
+    """
+    Load all analysis macros, the upload macro and the ads library into a new session in one submit
+    """
+    methods = [analysis["AnalysisMethod"] for analysis in catalog_store.load("standard_analysis_schema.json")]
+    program = SASProgram(SRC_PATH, sas_pool.loaded(sas), sas_pool.included(sas))
+    for method in methods:
+        program.include(f"{method.lower()}_macro")
+    program.include("upload_file_aws").libname("ads", ADS_PATH).submit(sas)
+
 
-def execute_sas_program(program_file):
+# SAS sessions are opened lazily on first use, not at import time
+pool = sas_pool.SessionPool(backend=sas_pool.backend_from_env(), on_create=warm_up if PRELOAD_MACROS else None)
+
+
+def execute_sas_program(program_file, sas=None):
     """
-    Function to execute a SAS program file
+    Function to execute a SAS program file (log only; raises SASProgramError if the log has errors)
     """
     with open(program_file, "r") as file:
         program = file.read()
@@ -19,173 +55,103 @@ def execute_sas_program(program_file):
 
     # code = open('/users/myuserid.files/SAS_filename.sas').read()
     # results_dict = sas.submit(code)
-    sas.submitLST(program)
+    with pool.session(sas) as sas:
+        return SASProgram(SRC_PATH).add(program).submit(sas)
 
 # TODO Function to convert Pandas DataFrame to JSON/Python Dictionary
 
 def getinfo():
     """
+    Refresh the dataset catalogs from the SAS data library (only datasets that changed are pulled)
 
+    :return: Report of added/modified/removed datasets and the catalog files written
     """
-    # dbconn
-
-    autoexec = sas.submitLST(
-        """
-        %include "/home/u50452179/src/getmetadata.sas";
-        %getmetadata(path=%str(/home/u50452179/data));
-        """)
-
-    # cursor = dbconn.cursor()
-
-    # TODO Upload current data path and data library name to database
-
-    #------------------#
-    # List of Datasets #
-    #------------------#
-
-    # specify SAS dataset
-    outds = sas.sasdata("out_datasets", libref='work')
-
-    # Convert the SAS dataset to pandas DataFrame
-    df_ds = outds.to_df()
-
-    # TODO Upload the list of datasets to PostgreSQL database
-
-
-    # Convert the DataFrame to list of dictionaries
-    data_list_ds = df_ds.to_dict('records')
-
-    # Define the output JSON file and path
-    output_ds = 'dataset_schema.json'
-
-    # Write the data to a JSON file
-    with open(output_ds, 'w') as f:
-        json.dump(data_list_ds, f, indent=2)
-
-    #-------------------#
-    # List of Variables #
-    #-------------------#
-
-    # specify SAS dataset
-    outds_var = sas.sasdata("outds_variables", libref = 'work')
-
-    # Convert the SAS dataset to pandas DataFrame
-    df_var = outds_var.to_df()
-
-    # TODO Upload the list of variables to PostgreSQL database
-
-    # Convert DataFrame to list of dictionaries
-    data_list_var = df_var.to_dict('records')
-
-    # Define the output JSON file and path
-    output_var = 'dataset_variable_schema.json'
-
-    # Write the data to a JSON file
-    with open(output_var, 'w') as f:
-        json.dump(data_list_var, f, indent=2)
-
-    #--------------------#
-    # List of Parameters #
-    #--------------------#
-
-    # specify SAS dataset
-    outds_ept = sas.sasdata("outds_endpoints", libref='work')
-
-    # Convert the SAS dataset to pandas DataFrame
-    df_ept = outds_ept.to_df()
-
-    # TODO Upload the list of parameters to PostgreSQL database
-
-    # Convert DataFrame to list of dictionaries
-    data_list_ept = df_ept.to_dict('records')
-
-    # Define the output JSON file and path
-    output_ept = 'dataset_endpoint_schema.json'
-
-    # Write the data to a JSON file
-    with open(output_ept, 'w') as f:
-        json.dump(data_list_ept, f, indent=2)
-
-    #--------------------#
-    # List of Population #
-    #--------------------#
-
-    # specify SAS dataset
-    outds_popuvar = sas.sasdata("outds_popuvar", libref = 'work')
+    with pool.session() as sas:
+        return _getinfo(sas)
 
-    # Convert the SAS dataset to pandas DataFrame
-    df_popuvar = outds_popuvar.to_df()
-
-    # TODO Upload the list of variables to PostgreSQL database
-
-    # Convert DataFrame to list of dictionaries
-    data_list_popuvar = df_popuvar.to_dict('records')
-
-    # Define the output JSON file and path
-    output_popuvar = 'dataset_population_schema.json'
-
-    # Write the data to a JSON file
-    with open(output_popuvar, 'w') as f:
-        json.dump(data_list_popuvar, f, indent=2)
-
-    #-------------------#
-    # List of Covariate #
-    #-------------------#
-
-    # specify SAS dataset
-    outds_covar = sas.sasdata("outds_covar", libref = 'work')
-
-    # Convert the SAS dataset to pandas DataFrame
-    df_covar = outds_covar.to_df()
-
-    # TODO Upload the list of variables to PostgreSQL database
-
-    # Convert DataFrame to list of dictionaries
-    data_list_covar = df_covar.to_dict('records')
-
-    # Define the output JSON file and path
-    output_covar = 'dataset_covariate_schema.json'
-
-    # Write the data to a JSON file
-    with open(output_covar, 'w') as f:
-        json.dump(data_list_covar, f, indent=2)
-
-    #---------------------------#
-    # List of Response Variable #
-    #---------------------------#
-
-    # specify SAS dataset
-    outds_rspvar = sas.sasdata("outds_rspvar", libref = 'work')
-
-    # Convert the SAS dataset to pandas DataFrame
-    df_rspvar = outds_rspvar.to_df()
-
-    # TODO Upload the list of variables to PostgreSQL database
-
-    # Convert DataFrame to list of dictionaries
-    data_list_rspvar = df_rspvar.to_dict('records')
-
-    # Define the output JSON file and path
-    output_rspvar = 'dataset_rspvar_schema.json'
-
-    # Write the data to a JSON file
-    with open(output_rspvar, 'w') as f:
-        json.dump(data_list_rspvar, f, indent=2)
+def dataset_stamps(sas):
+    """
+    Modification date and variable count of every dataset in the ads library
+    """
+    (
+        SASProgram(SRC_PATH, sas_pool.loaded(sas))
+        .libname("ads", ADS_PATH)
+        .add("""proc sql;
+create table work.biostat_stamps as
+select memname, put(modate, datetime20.) as modified, nvar
+from dictionary.tables where libname = 'ADS' and memtype = 'DATA';
+quit;""")
+        .submit(sas)
+    )
+    df = sas.sasdata("biostat_stamps", libref="work").to_df()
+    return {row["memname"]: {"modified": row["modified"], "nvar": int(row["nvar"])} for row in df.to_dict("records")}
+
+def fetch_metadata(sas, datasets, workdir):
+    """
+    Run %getmetadata and pull the metadata tables, restricted to `datasets`
 
-def download(file, output):
+    :param workdir: Local directory for the bulk export file
+    :return: Rows of each metadata table (lazy iterators in bulk mode)
+    """
+    where = "upcase(dataset_name) in (" + " ".join(f"'{name.upper()}'" for name in datasets) + ")"
+    program = (
+        SASProgram(SRC_PATH, sas_pool.loaded(sas))
+        .include("getmetadata")
+        .add(call("getmetadata", f"path=%str({ADS_PATH})"))
+    )
+
+    if METADATA_TRANSFER == "dataframe":
+        program.submit(sas)
+        tables = {}
+        for table in catalog_refresh.CATALOGS:
+            # Convert the SAS dataset to pandas DataFrame, then to a list of dictionaries
+            outds = sas.sasdata(table, libref="work", dsopts={"where": where})
+            tables[table] = outds.to_df().to_dict("records")
+        return tables
+
+    # Every table goes into one CSV in the SAS work directory, tagged with its table name
+    program.add(f"%let _bulk = %sysfunc(pathname(work))/biostat_metadata.csv;\n%put {_BULK_MARKER}=&_bulk;")
+    for i, (table, fields) in enumerate(catalog_refresh.FIELDS.items()):
+        program.add(f"""data _null_;
+file "&_bulk" dsd dlm=',' lrecl=32767{'' if i == 0 else ' mod'} encoding='utf-8';
+length _table $32;
+set work.{table}(where=({where}));
+_table = "{table}";
+put _table {' '.join(fields)};
+run;""")
+    log = program.submit(sas)
+    remote = next(line.split("=", 1)[1].strip() for line in log.text.splitlines() if line.startswith(_BULK_MARKER + "="))
+
+    local = os.path.join(workdir, "biostat_metadata.csv")
+    result = sas.download(local, remote)
+    if not result.get("Success"):
+        raise RuntimeError(f"Metadata download failed: {result.get('LOG', '')}")
+    return catalog_refresh.read_bulk(local)
+
+def _getinfo(sas):
+    stamps = dataset_stamps(sas)
+    with tempfile.TemporaryDirectory() as workdir:
+        report = catalog_refresh.refresh(stamps, lambda datasets: fetch_metadata(sas, datasets, workdir))
+    # Load changed catalogs into the catalog database
+    catalog_db.sync(stamps, path=ADS_PATH)
+    return report
+
+def download(file, output, sas=None):
     """
     Download file from SAS remote server
 
     :param file: File to download from SAS server
     :param output: Output file name
+    :param sas: SAS session to use (checked out from the pool if not given)
     :return: True if the file is downloaded successfully
     """
     # local_file = os.path.expanduser("~/Dropbox/Workspace/") + output
     local_file = output
     remote_file = "/home/u50452179/output/" + file
-    return sas.download(local_file, remotefile=remote_file)
+    with pool.session(sas) as sas:
+        return sas.download(local_file, remotefile=remote_file)
 
-def upload_file(file_name, bucket="llm-integration", object_name=None, region="us-east-2", folder="output"):
+def upload_file(file_name, bucket="llm-integration", object_name=None, region="us-east-2", folder="output", sas=None):
     """
     Upload a file to an S3 bucket (code from AWS)
 
@@ -194,12 +160,18 @@ def upload_file(file_name, bucket="llm-integration", object_name=None, region="u
     :param object_name: S3 object name. If not specified then file_name is used
     :param region: AWS S3 region name
     :param folder: Destination folder name
+    :param sas: SAS session to use (checked out from the pool if not given)
     :return: True if file was uploaded, else False
     """
     # TODO Add Procedures to Save to AWS S3 Directly
 
-    include(macro_name="upload_file_aws")
-    sas.submitLST(f"%upload_file_aws(filename=%str({file_name}));")
+    with pool.session(sas) as sas:
+        (
+            SASProgram(SRC_PATH, sas_pool.loaded(sas))
+            .include("upload_file_aws")
+            .add(upload_call(file_name))
+            .submit(sas)
+        )
 
     # -------------------------------------------------- #
     # If S3 object_name was not specified, use file_name #
@@ -217,24 +189,41 @@ def upload_file(file_name, bucket="llm-integration", object_name=None, region="u
     #     logging.error(e)
     #     return False
 
+    return s3_url(file_name, bucket=bucket, region=region)
+
+def upload_call(file_name):
+    """
+    SAS code that uploads an output file to S3
+    """
+    return call("upload_file_aws", f"filename=%str({file_name})")
+
+def s3_url(file_name, bucket="llm-integration", region="us-east-2"):
+    """
+    Public URL of an uploaded output file
+    """
     # TODO add folder later
     return f"https://{bucket}.s3.{region}.amazonaws.com/{file_name}"
 
-def include(macro_name):
-    sas.submitLST(f"%include '/home/u50452179/src/{macro_name}.sas';")
+def include(macro_name, sas=None):
+    """
+    Include a macro file in the session, unless this session has already loaded it
+    """
+    with pool.session(sas) as sas:
+        SASProgram(SRC_PATH, sas_pool.loaded(sas), sas_pool.included(sas)).include(macro_name).submit(sas)
 
-def include_analysis(analysis_method):
+def include_analysis(analysis_method, sas=None):
     """
     Include certain SAS file in the session
     """
     method = analysis_method.lower()
-    include(f"{method}_macro")
+    include(f"{method}_macro", sas=sas)
 
-def data_library(ads_location="/home/u50452179/data"):
+def data_library(ads_location=ADS_PATH, sas=None):
     """
-    Add data library location for the upcoming analysis
+    Add data library location for the upcoming analysis (skipped if the session already has it)
     """
-    sas.submitLST(f"libname ads '{ads_location}';")
+    with pool.session(sas) as sas:
+        SASProgram(SRC_PATH, sas_pool.loaded(sas)).libname("ads", ads_location).submit(sas)
 
 def find_data(analysis_details):
     """
@@ -251,24 +240,77 @@ def execute_analysis(analysis_details):
 
     analysis_method = analysis_details["AnalysisMethod"]
 
-    include_analysis(analysis_method)
-    data_library()
+    with pool.session() as sas:
+        return _execute_analysis(analysis_details, analysis_method, sas)
 
-    filename = analysis_method + "_" + analysis_details["UserID"] + "_" + str(analysis_details["SessionID"])
-
-    f = open("generated/" + filename + ".sas", "w")
-    f.write(f"%{analysis_method}(inds={find_data(analysis_details)}")
-    for key, value in analysis_details['Parameters'].items():
-        f.write(f",{key}={value}")
-    f.write(f",filename=%str({filename})")
-    f.write(");")
-    f.close()
-
-    execute_sas_program("generated/" + filename + ".sas")
-
-    aws_url = upload_file(filename + ".pdf")
-
-    return aws_url
+def analysis_program(analysis_details, filename, loaded=None, included=None):
+    """
+    Build the whole analysis (includes, libname, input dataset stamp, macro call, upload) as one SAS program
+    """
+    analysis_method = analysis_details["AnalysisMethod"]
+    dataset = find_data(analysis_details)
+    program = (
+        SASProgram(SRC_PATH, loaded, included)
+        .include(f"{analysis_method.lower()}_macro")
+        .include("upload_file_aws")
+        .libname("ads", ADS_PATH)
+        .add(sas_program.dataset_stamp(f"data:{dataset}", f"ads.{dataset}"))
+    )
+    program.add(call(analysis_method, f"inds={dataset}",
+                     **analysis_details["Parameters"], filename=f"%str({filename})"))
+    return program.add(upload_call(filename + ".pdf"))
+
+def dataset_stamp(dataset, sas):
+    """
+    Current modification stamp of an ads dataset (also remembered as its last seen stamp)
+    """
+    log = (
+        SASProgram(SRC_PATH, sas_pool.loaded(sas))
+        .libname("ads", ADS_PATH)
+        .add(sas_program.dataset_stamp(f"data:{dataset}", f"ads.{dataset}"))
+        .submit(sas)
+    )
+    stamp = _data_stamps[dataset] = log.stamps.get(f"data:{dataset}", "")
+    return stamp
+
+def _known(stamp):
+    return stamp not in (None, "", ".")
+
+def _execute_analysis(analysis_details, analysis_method, sas):
+    dataset = find_data(analysis_details)
+    macro = f"{analysis_method.lower()}_macro"
+    parameters = analysis_details["Parameters"]
+    if result_cache.ENABLED:
+        # Keyed by the macro version this session actually runs (stamped when it was included) and the
+        # dataset stamp seen last; a cached result is only used once that dataset stamp is confirmed.
+        # Without both stamps the result cannot be keyed reliably and the cache is bypassed.
+        macro_stamp = sas_pool.included(sas).get(macro)
+        data_stamp = _data_stamps.get(dataset)
+        if _known(macro_stamp) and _known(data_stamp):
+            url = result_cache.get(result_cache.key(analysis_method, parameters, dataset, macro_stamp, data_stamp))
+            if url is not None and dataset_stamp(dataset, sas) == data_stamp:
+                return url
+        # Each run writes its own output, so a cached URL is never overwritten
+        filename = analysis_method + "_" + uuid.uuid4().hex[:16]
+    else:
+        filename = analysis_method + "_" + analysis_details["UserID"] + "_" + str(analysis_details["SessionID"])
+
+    # One round trip: setup the session already has is left out, and the stamps come back in the same log
+    program = analysis_program(analysis_details, filename, sas_pool.loaded(sas), sas_pool.included(sas))
+
+    with open("generated/" + filename + ".sas", "w") as f:
+        f.write(program.render())
+
+    log = program.submit(sas)
+
+    url = s3_url(filename + ".pdf")
+    if result_cache.ENABLED:
+        macro_stamp = sas_pool.included(sas).get(macro)
+        data_stamp = _data_stamps[dataset] = log.stamps.get(f"data:{dataset}", "")
+        if _known(macro_stamp) and _known(data_stamp):
+            result_cache.put(result_cache.key(analysis_method, parameters, dataset, macro_stamp, data_stamp),
+                             url, analysis_method)
+    return url
 
 if __name__ == "__main__":
     # test for download functionality
@@ -282,4 +324,4 @@ if __name__ == "__main__":
     # print(url)
 
     # test for getinfo()
-    getinfo()
\ No newline at end of file
+    print(getinfo())
\ No newline at end of file
@@ -72,10 +72,14 @@ class ADKOrchestratorClient:
             self._runner = create_inmemory_runner()
         return self._runner
 
-    async def send_message(self, user_input: str) -> str:
+    async def send_message(self, user_input: str, session_id: Optional[str] = None) -> str:
         """
         Run the root agent against user input using run_debug for traceability.
+        Each session ID maps to its own ADK session on the shared runner.
         """
         runner = self.ensure_runner()
-        result = await runner.run_debug(user_input)
+        if session_id is None:
+            result = await runner.run_debug(user_input)
+        else:
+            result = await runner.run_debug(user_input, session_id=session_id)
         return result.text if hasattr(result, "text") else str(result)
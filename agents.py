@@ -94,7 +94,10 @@ def parameter_collector_agent() -> Agent:
         description="Conversational slot-filler for missing parameters.",
         instruction=(
             "Ask one question at a time. Summarize known parameters, request missing ones, "
-            "and present options via the catalog tool. When ask_for is empty or confirmed, "
+            "and present options via the catalog tool; pass the user's own words as query so "
+            "only the best matches are shown. Options come one page at a time: when "
+            "more_available is true, say more options exist and offer to narrow the search or "
+            "show the next page (offset=next_offset). When ask_for is empty or confirmed, "
             "call exit_loop to end the loop. Maintain clarity and brevity."
         ),
         tools=[
@@ -111,7 +114,10 @@ def dataset_catalog_agent() -> Agent:
         name="dataset_catalog",
         model=_model(),
         description="Serves allowed values for dataset-driven parameters.",
-        instruction="Return allowed options for Endpoint, Population, ResponseVariable, Covariate, CovarianceMatrix.",
+        instruction=(
+            "Return allowed options for Endpoint, Population, ResponseVariable, Covariate, CovarianceMatrix. "
+            "When the user describes a value, call list_options with it as query and return the top matches."
+        ),
         tools=[FunctionTool(tools.catalog.list_options, name="list_options")],
         output_key="options",
     )
@@ -1,9 +1,14 @@
 # Import necessary libraries
+import json
 import markdown
-from flask import Flask, render_template, request, redirect
+from flask import Flask, Response, render_template, request, redirect, make_response, jsonify
 from orchestrator_service import OrchestratorAgent
+import sas_jobs
+from session_manager import valid_session_id
 import os
 import time
+import traceback
+import uuid
 # import llm_db
 
 ## Original Chatbot Set up
@@ -56,6 +61,20 @@ chat_history = ''
 # Create a Flask web application
 app = Flask(__name__)
 
+# Each browser gets its own chatbot state, keyed by this cookie (or the X-Session-ID header)
+SESSION_COOKIE = "biostat_session"
+
+
+def get_session_id():
+    session_id = request.headers.get("X-Session-ID") or request.cookies.get(SESSION_COOKIE)
+    return session_id if valid_session_id(session_id) else uuid.uuid4().hex
+
+
+def with_session_cookie(body, session_id):
+    resp = make_response(body)
+    resp.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return resp
+
 # # Function to complete chat input using OpenAI's GPT-3.5 Turbo
 # def chatcompletion(user_input, impersonated_role, explicit_input, chat_history):
 #     output = openai.ChatCompletion.create(
@@ -96,17 +115,70 @@ app = Flask(__name__)
 # Define app routes
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return with_session_cookie(render_template("index.html"), get_session_id())
 
 @app.route("/get")
 # Function for the bot response
 def get_bot_response():
 
     user_input = request.args.get('msg')
-    ai_response = orchestrator.handle_message(user_input)
+    session_id = get_session_id()
+    # Under WSGI this worker waits for the whole turn; asgi.py serves this route without holding a thread
+    ai_response = orchestrator.submit_message(user_input, session_id=session_id).result()
 
     html = markdown.markdown(ai_response)
-    return str(html)
+    return with_session_cookie(str(html), session_id)
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# What the client sees when a streamed reply fails; the exception itself only goes to the server log
+STREAM_FAILURE = "the reply could not be generated, please try again."
+
+def stream_failure(session_id):
+    print(f"Streaming reply failed for session {session_id}:")
+    traceback.print_exc()
+    return sse("failure", {"error": STREAM_FAILURE})
+
+@app.route("/stream")
+# Streaming variant of /get: Server-Sent Events with the raw text of each chunk, and the rendered reply once done
+def stream_bot_response():
+
+    user_input = request.args.get('msg')
+    session_id = get_session_id()
+
+    def events():
+        try:
+            for kind, piece in orchestrator.stream_message(user_input, session_id=session_id):
+                if kind == "token":
+                    yield sse("token", {"text": piece})
+                else:
+                    yield sse("done", {"html": markdown.markdown(piece)})
+        except Exception:
+            yield stream_failure(session_id)
+
+    resp = Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    resp.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return resp
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = sas_jobs.queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "error_message": f"Unknown job: {job_id}"}), 404
+    return jsonify({key: job[key] for key in sas_jobs.PUBLIC_FIELDS if key in job})
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = sas_jobs.queue().get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "error_message": f"Unknown job: {job_id}"}), 404
+    if job["status"] == sas_jobs.SUCCEEDED:
+        return redirect(job["result_url"])
+    if job["status"] == sas_jobs.FAILED:
+        return jsonify({"status": job["status"], "error_message": job["error"]}), 500
+    return jsonify({"status": job["status"]}), 202
 
 @app.route('/refresh')
 def refresh():
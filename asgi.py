@@ -0,0 +1,96 @@
+"""
+ASGI entry point: `uvicorn asgi:app`.
+
+`/get` and `/stream` are served as coroutines on the server's event loop. A chat turn
+waits for the shared loop (`async_runtime`) without holding a server thread, so one
+process keeps many conversations in flight; only the blocking chatbot flow itself
+takes a thread, from the `ASYNC_MAX_WORKERS` executor, while it runs. Every other
+route goes to the Flask app through asgiref's WSGI adapter.
+"""
+
+import uuid
+from http.cookies import CookieError, SimpleCookie
+from typing import Optional
+from urllib.parse import parse_qs
+
+import markdown
+from asgiref.wsgi import WsgiToAsgi
+
+import app as flask_app
+from session_manager import valid_session_id
+
+orchestrator = flask_app.orchestrator
+_wsgi = WsgiToAsgi(flask_app.app)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _session_id(scope) -> str:
+    session_id = _header(scope, b"x-session-id")
+    if not session_id:
+        try:
+            morsel = SimpleCookie(_header(scope, b"cookie") or "").get(flask_app.SESSION_COOKIE)
+        except CookieError:
+            morsel = None
+        session_id = morsel.value if morsel else None
+    return session_id if valid_session_id(session_id) else uuid.uuid4().hex
+
+
+def _message(scope) -> Optional[str]:
+    return parse_qs(scope["query_string"].decode("latin-1")).get("msg", [None])[0]
+
+
+async def _start(send, session_id: str, content_type: str, headers=()) -> None:
+    cookie = f"{flask_app.SESSION_COOKIE}={session_id}; HttpOnly; Path=/; SameSite=Lax"
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", content_type.encode()), (b"set-cookie", cookie.encode()), *headers],
+    })
+
+
+async def get_bot_response(scope, send) -> None:
+    session_id = _session_id(scope)
+    ai_response = await orchestrator.reply(_message(scope), session_id=session_id)
+    await _start(send, session_id, "text/html; charset=utf-8")
+    await send({"type": "http.response.body", "body": markdown.markdown(ai_response).encode()})
+
+
+async def stream_bot_response(scope, send) -> None:
+    session_id = _session_id(scope)
+    await _start(send, session_id, "text/event-stream",
+                 [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")])
+    try:
+        async for kind, piece in orchestrator.stream_message_async(_message(scope), session_id=session_id):
+            if kind == "token":
+                event = flask_app.sse("token", {"text": piece})
+            else:
+                event = flask_app.sse("done", {"html": markdown.markdown(piece)})
+            await send({"type": "http.response.body", "body": event.encode(), "more_body": True})
+    except Exception:
+        event = flask_app.stream_failure(session_id)
+        await send({"type": "http.response.body", "body": event.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+_ROUTES = {"/get": get_bot_response, "/stream": stream_bot_response}
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    elif scope["type"] == "http" and scope["path"] in _ROUTES:
+        await _ROUTES[scope["path"]](scope, send)
+    else:
+        await _wsgi(scope, receive, send)
@@ -0,0 +1,95 @@
+"""
+Process-wide asyncio runtime.
+
+One event loop runs for the lifetime of the process on a daemon thread. The
+ADK runner and other async clients live on it, so requests no longer create
+and tear down a loop per message (`asyncio.run`). Blocking SDK calls (the
+synchronous `BiostatChatbot` flow, Gemini/Groq clients, saspy) are offloaded to
+a bounded thread pool so they never stall the loop.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import os
+import threading
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+MAX_WORKERS = int(os.getenv("ASYNC_MAX_WORKERS", "32"))
+
+
+class AsyncRuntime:
+
+    def __init__(self, max_workers: int = MAX_WORKERS) -> None:
+        self.max_workers = max_workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        The shared event loop, started on first use.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="biostat-blocking"
+                )
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(self._executor)
+                self._thread = threading.Thread(target=loop.run_forever, name="biostat-event-loop", daemon=True)
+                self._thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        """
+        Schedule a coroutine on the shared loop from any thread.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """
+        Run a coroutine on the shared loop and wait for its result (for synchronous callers).
+        """
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("AsyncRuntime.run() called from the event loop thread; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def to_thread(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a blocking call in the bounded executor without blocking the loop.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._executor.shutdown(wait=False)
+            self._loop.close()
+            self._loop = self._thread = self._executor = None
+
+
+runtime = AsyncRuntime()
+
+
+def submit(coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+    return runtime.submit(coro)
+
+
+def run(coro: Awaitable[T]) -> T:
+    return runtime.run(coro)
+
+
+async def to_thread(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    return await runtime.to_thread(func, *args, **kwargs)
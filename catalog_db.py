@@ -0,0 +1,397 @@
+"""
+SQLite catalog database.
+
+Holds the dataset catalogs in the tables sketched in `db/sql-schema.sql`:
+`data_library` (the study data library, `CATALOG_LIBRARY`, with its path and
+last refresh), `data_list` (datasets), `data_vars` (variables, tagged with the
+catalog role they came from: all variables, population flags, covariates,
+response variables) and `data_param` (endpoint parameters). The catalogs in
+`schema/` describe one library; rows carry its `library_id` as in the sketch
+and are indexed on `dataset_name`, `variable_name`, `paramcd` and the labels
+(NOCASE), so code lookups and prefix searches stay index seeks as it grows.
+An FTS5 table (`catalog_fts`) over each row's code (`paramcd`/`variable_name`)
+and label (`param`/`variable_label`) backs ranked search (`rank`): "agitation
+score" -> NPITM03S, so prompts carry only the best few options.
+
+The JSON catalogs in `schema/` remain the interchange format. Each catalog is
+(re)loaded into the database when its content digest differs from the one
+recorded at the last sync, so `SASConnect.getinfo()` and every reader process
+converge on the same rows without reloading unchanged catalogs.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import catalog_store
+
+DB_PATH = os.getenv("CATALOG_DB_PATH", os.getenv("ADK_DB_PATH", "adk.db"))
+LIBRARY = os.getenv("CATALOG_LIBRARY", "ads")
+
+# JSON catalog -> (table, data_vars role, columns)
+CATALOGS: Dict[str, Tuple[str, Optional[str], Tuple[str, ...]]] = {
+    "dataset_schema.json": ("data_list", None, ("dataset_name", "dataset_label")),
+    "dataset_variable_schema.json": ("data_vars", "variable", ("dataset_name", "variable_name", "variable_label")),
+    "dataset_population_schema.json": ("data_vars", "population", ("dataset_name", "variable_name", "variable_label")),
+    "dataset_covariate_schema.json": ("data_vars", "covariate", ("dataset_name", "variable_name", "variable_label")),
+    "dataset_rspvar_schema.json": ("data_vars", "response", ("dataset_name", "variable_name", "variable_label")),
+    "dataset_endpoint_schema.json": ("data_param", None, ("dataset_name", "param", "paramcd")),
+}
+
+# Parameter name (lower case) -> JSON catalog
+PARAM_CATALOGS: Dict[str, str] = {
+    "endpoint": "dataset_endpoint_schema.json",
+    "population": "dataset_population_schema.json",
+    "responsevariable": "dataset_rspvar_schema.json",
+    "covariate": "dataset_covariate_schema.json",
+}
+
+# Table -> (code column, label column)
+_KEYS = {
+    "data_list": ("dataset_name", "dataset_label"),
+    "data_vars": ("variable_name", "variable_label"),
+    "data_param": ("paramcd", "param"),
+}
+
+SEARCH_LIMIT = int(os.getenv("CATALOG_SEARCH_LIMIT", "10"))
+# Options per page when a whole catalog is listed (prompts, list_options)
+PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "20"))
+
+_STOPWORDS = frozenset({"a", "an", "and", "as", "at", "by", "for", "from", "in", "of", "on", "or", "the", "to", "with"})
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_library (
+    library_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT,
+    refreshed_at REAL
+);
+CREATE TABLE IF NOT EXISTS data_list (
+    library_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    dataset_name TEXT NOT NULL COLLATE NOCASE,
+    dataset_label TEXT COLLATE NOCASE,
+    modified TEXT,
+    nvar INTEGER
+);
+CREATE INDEX IF NOT EXISTS data_list_seq ON data_list(library_id, seq);
+CREATE INDEX IF NOT EXISTS data_list_name ON data_list(library_id, dataset_name);
+CREATE INDEX IF NOT EXISTS data_list_label ON data_list(library_id, dataset_label);
+CREATE TABLE IF NOT EXISTS data_vars (
+    library_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    dataset_name TEXT NOT NULL COLLATE NOCASE,
+    variable_name TEXT NOT NULL COLLATE NOCASE,
+    variable_label TEXT COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS data_vars_seq ON data_vars(library_id, role, seq);
+CREATE INDEX IF NOT EXISTS data_vars_name ON data_vars(library_id, role, variable_name);
+CREATE INDEX IF NOT EXISTS data_vars_dataset ON data_vars(library_id, role, dataset_name);
+CREATE INDEX IF NOT EXISTS data_vars_label ON data_vars(library_id, role, variable_label);
+CREATE TABLE IF NOT EXISTS data_param (
+    library_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    dataset_name TEXT NOT NULL COLLATE NOCASE,
+    param TEXT COLLATE NOCASE,
+    paramcd TEXT NOT NULL COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS data_param_seq ON data_param(library_id, seq);
+CREATE INDEX IF NOT EXISTS data_param_code ON data_param(library_id, paramcd);
+CREATE INDEX IF NOT EXISTS data_param_dataset ON data_param(library_id, dataset_name);
+CREATE INDEX IF NOT EXISTS data_param_label ON data_param(library_id, param);
+CREATE VIRTUAL TABLE IF NOT EXISTS catalog_fts USING fts5(
+    code, label, name UNINDEXED, library_id UNINDEXED, seq UNINDEXED, tokenize = 'unicode61'
+);
+CREATE TABLE IF NOT EXISTS catalog_source (
+    library_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    digest TEXT,
+    PRIMARY KEY (library_id, name)
+);
+"""
+
+
+def _value(value: Any) -> Any:
+    # NaN (missing SAS label) is stored as NULL
+    return None if isinstance(value, float) and value != value else value
+
+
+def _row(columns: Sequence[str], values: Iterable[Any]) -> Dict[str, Any]:
+    # ...and read back as NaN, like the JSON catalogs
+    return {c: float("nan") if v is None else v for c, v in zip(columns, values)}
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def fts_query(text: str) -> str:
+    """
+    FTS5 query matching any word of `text` by prefix (plain words cut to 6 characters, so
+    "agitated" finds "Agitation"); bm25 ranks rows that match more words higher.
+    """
+    words = [w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in _STOPWORDS]
+    # Codes (words with digits, e.g. NPITM03S) are matched whole
+    terms = [w if not w.isalpha() else w[:6] for w in words]
+    return " OR ".join(f'"{t}"*' for t in dict.fromkeys(terms))
+
+
+def select_columns(name: str, fields: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+    """
+    `fields` checked against the columns of catalog `name` (all of them when empty); an unknown field is a
+    ValueError, so caller text never reaches the SQL.
+    """
+    columns = CATALOGS[name][2]
+    if not fields:
+        return columns
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields for {name}: {', '.join(map(str, unknown))}; available: {', '.join(columns)}")
+    return tuple(fields)
+
+
+class CatalogDB:
+
+    def __init__(self, db_path: str = DB_PATH, library: str = LIBRARY,
+                 store: catalog_store.CatalogStore = catalog_store.store) -> None:
+        self.library = library
+        self.store = store
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        # (library_id, catalog) -> digest this process last saw in the database
+        self._synced: Dict[Tuple[int, str], str] = {}
+        with self._lock:
+            has_fts = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'catalog_fts'"
+            ).fetchone() is not None
+            self._conn.executescript(_SCHEMA)
+            if not has_fts:
+                # Database predates the search index: reload every catalog once to fill it
+                self._conn.execute("DELETE FROM catalog_source")
+            self._conn.commit()
+
+    def library_id(self, path: Optional[str] = None) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT library_id FROM data_library WHERE name = ?", (self.library,)).fetchone()
+            if row is not None:
+                if path is not None:
+                    self._conn.execute("UPDATE data_library SET path = ? WHERE library_id = ?", (path, row[0]))
+                    self._conn.commit()
+                return row[0]
+            cur = self._conn.execute("INSERT INTO data_library(name, path) VALUES (?, ?)", (self.library, path))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def _load(self, library_id: int, name: str, digest: str) -> None:
+        # Called with the lock held, inside a transaction.
+        table, role, columns = CATALOGS[name]
+        rows = self.store.load(name)
+        where, params = "library_id = ?", [library_id]
+        if role is not None:
+            where, params = where + " AND role = ?", params + [role]
+        self._conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+        insert_columns = ("library_id",) + (("role",) if role else ()) + ("seq",) + columns
+        prefix = [library_id] + ([role] if role else [])
+        self._conn.executemany(
+            f"INSERT INTO {table}({', '.join(insert_columns)}) VALUES ({', '.join('?' * len(insert_columns))})",
+            (prefix + [seq] + [_value(row.get(c)) for c in columns] for seq, row in enumerate(rows)),
+        )
+        code, label = _KEYS[table]
+        self._conn.execute("DELETE FROM catalog_fts WHERE library_id = ? AND name = ?", (library_id, name))
+        self._conn.executemany(
+            "INSERT INTO catalog_fts(code, label, name, library_id, seq) VALUES (?, ?, ?, ?, ?)",
+            ((_value(row.get(code)), _value(row.get(label)), name, library_id, seq) for seq, row in enumerate(rows)),
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO catalog_source(library_id, name, digest) VALUES (?, ?, ?)",
+            (library_id, name, digest),
+        )
+
+    def ensure(self, names: Optional[Iterable[str]] = None) -> int:
+        """
+        Bring the given catalogs (all with `names` None) in line with the JSON files; returns the library_id.
+        """
+        with self._lock:
+            library_id = self.library_id()
+            wanted = [(name, self.store.digest(name)) for name in (names or CATALOGS)]
+            stale = [(name, digest) for name, digest in wanted if self._synced.get((library_id, name)) != digest]
+            if not stale:
+                return library_id
+            recorded = dict(self._conn.execute(
+                "SELECT name, digest FROM catalog_source WHERE library_id = ?", (library_id,)
+            ).fetchall())
+            with self._conn:
+                for name, digest in stale:
+                    if recorded.get(name) != digest:
+                        self._load(library_id, name, digest)
+                    self._synced[(library_id, name)] = digest
+            return library_id
+
+    def digest(self, name: str) -> str:
+        """
+        Content digest of catalog `name` as loaded into the database; changes whenever its rows are reloaded.
+        """
+        with self._lock:
+            library_id = self.ensure([name])
+            return self._synced[(library_id, name)]
+
+    def sync(self, stamps: Optional[Dict[str, Dict[str, Any]]] = None, path: Optional[str] = None) -> None:
+        """
+        Reload changed catalogs after a refresh and record dataset stamps (modification date, variable count).
+        """
+        with self._lock:
+            library_id = self.library_id(path)
+            self.ensure()
+            with self._conn:
+                for dataset, stamp in (stamps or {}).items():
+                    self._conn.execute(
+                        "UPDATE data_list SET modified = ?, nvar = ? WHERE library_id = ? AND dataset_name = ?",
+                        (stamp.get("modified"), stamp.get("nvar"), library_id, dataset),
+                    )
+                self._conn.execute(
+                    "UPDATE data_library SET refreshed_at = ? WHERE library_id = ?", (time.time(), library_id)
+                )
+
+    def _where(self, name: str, dataset_name: Optional[str]) -> Tuple[str, List[Any]]:
+        table, role, _ = CATALOGS[name]
+        where, params = "library_id = ?", [self.ensure([name])]
+        if role is not None:
+            where, params = where + " AND role = ?", params + [role]
+        if dataset_name:
+            where, params = where + " AND dataset_name = ?", params + [dataset_name]
+        return where, params
+
+    def rows(self, name: str, fields: Optional[Sequence[str]] = None, dataset_name: Optional[str] = None,
+             limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Rows of catalog `name` in catalog order, optionally projected to `fields`, filtered to one dataset
+        and cut to one page (`limit` rows from `offset`).
+        """
+        table, _, columns = CATALOGS[name]
+        columns = select_columns(name, fields)
+        where, params = self._where(name, dataset_name)
+        with self._lock:
+            result = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY seq LIMIT ? OFFSET ?",
+                params + [-1 if limit is None else limit, offset],
+            ).fetchall()
+        return [_row(columns, values) for values in result]
+
+    def count(self, name: str, dataset_name: Optional[str] = None) -> int:
+        table = CATALOGS[name][0]
+        where, params = self._where(name, dataset_name)
+        with self._lock:
+            return self._conn.execute(f"SELECT count(*) FROM {table} WHERE {where}", params).fetchone()[0]
+
+    def lookup(self, param: str, value: Any, labels: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Catalog row whose code (or, with `labels`, code or label) matches `value` (case/whitespace-insensitive)
+        for `param`, or None.
+        """
+        name = PARAM_CATALOGS.get(param.lower())
+        if name is None or value is None:
+            return None
+        table, role, columns = CATALOGS[name]
+        code, label = _KEYS[table]
+        library_id = self.ensure([name])
+        value = " ".join(str(value).split())
+        where, params = f"library_id = ? AND {code} = ?", [library_id, value]
+        if labels:
+            where, params = f"library_id = ? AND ({code} = ? OR {label} = ?)", [library_id, value, value]
+        if role is not None:
+            where, params = where + " AND role = ?", params + [role]
+        with self._lock:
+            values = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY seq LIMIT 1", params
+            ).fetchone()
+        return _row(columns, values) if values is not None else None
+
+    def search(self, name: str, text: str, mode: str = "prefix", limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Rows whose label or code starts with (`mode="prefix"`) or contains (`mode="like"`) `text`, case-insensitively.
+        """
+        table, _, columns = CATALOGS[name]
+        code, label = _KEYS[table]
+        pattern = _like_escape(" ".join(text.split()))
+        pattern = pattern + "%" if mode == "prefix" else f"%{pattern}%"
+        where, params = self._where(name, None)
+        with self._lock:
+            result = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {where} "
+                f"AND ({label} LIKE ? ESCAPE '\\' OR {code} LIKE ? ESCAPE '\\') ORDER BY seq LIMIT ? OFFSET ?",
+                params + [pattern, pattern, limit, offset],
+            ).fetchall()
+        return [_row(columns, values) for values in result]
+
+    def rank(self, name: str, text: str, limit: int = SEARCH_LIMIT, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Rows of catalog `name` best matching free text (bm25 over code and label; code hits weigh double).
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        table, role, columns = CATALOGS[name]
+        library_id = self.ensure([name])
+        where, params = "t.library_id = ?", [library_id]
+        if role is not None:
+            where, params = where + " AND t.role = ?", params + [role]
+        with self._lock:
+            result = self._conn.execute(
+                f"SELECT {', '.join('t.' + c for c in columns)} FROM "
+                "(SELECT seq, bm25(catalog_fts, 2.0, 1.0) AS score FROM catalog_fts "
+                " WHERE catalog_fts MATCH ? AND name = ? AND library_id = ?) AS f "
+                f"JOIN {table} AS t ON t.seq = f.seq WHERE {where} ORDER BY f.score, t.seq LIMIT ? OFFSET ?",
+                [query, name, library_id] + params + [limit, offset],
+            ).fetchall()
+        return [_row(columns, values) for values in result]
+
+
+_db: Optional[CatalogDB] = None
+_db_lock = threading.Lock()
+
+
+def db() -> CatalogDB:
+    """
+    The process-wide catalog database, opened on first use.
+    """
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = CatalogDB()
+        return _db
+
+
+def rows(name: str, fields: Optional[Sequence[str]] = None, dataset_name: Optional[str] = None,
+         limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+    return db().rows(name, fields, dataset_name, limit=limit, offset=offset)
+
+
+def count(name: str, dataset_name: Optional[str] = None) -> int:
+    return db().count(name, dataset_name)
+
+
+def digest(name: str) -> str:
+    return db().digest(name)
+
+
+def lookup(param: str, value: Any, labels: bool = False) -> Optional[Dict[str, Any]]:
+    return db().lookup(param, value, labels)
+
+
+def search(name: str, text: str, mode: str = "prefix", limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+    return db().search(name, text, mode, limit, offset=offset)
+
+
+def rank(name: str, text: str, limit: int = SEARCH_LIMIT, offset: int = 0) -> List[Dict[str, Any]]:
+    return db().rank(name, text, limit, offset=offset)
+
+
+def sync(stamps: Optional[Dict[str, Dict[str, Any]]] = None, path: Optional[str] = None) -> None:
+    db().sync(stamps, path)
@@ -0,0 +1,163 @@
+"""
+Incremental refresh of the dataset catalogs under `schema/`.
+
+`SASConnect.getinfo()` reads a modification stamp (date and variable count)
+for every dataset in the data library and hands it to `refresh()`. The stamps
+are compared with the snapshot saved by the previous refresh; only datasets
+that were added or modified are pulled from SAS, their rows replace the old
+ones in each catalog, rows of removed datasets are dropped, and only catalogs
+whose content actually changed are rewritten. Every file is written to a
+temporary file and renamed into place, and the stamp snapshot is written last,
+so an interrupted refresh leaves the previous catalogs intact and is simply
+redone next time.
+
+The metadata itself comes back from SAS as one delimited file (`read_bulk`):
+each line is the metadata table name followed by that table's `FIELDS`, so all
+tables arrive in a single download and are parsed lazily with `csv` instead of
+one pandas transfer per table.
+"""
+
+import csv
+import filecmp
+import json
+import os
+import tempfile
+import textwrap
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import catalog_store
+
+# Metadata table produced by %getmetadata -> catalog file
+CATALOGS: Dict[str, str] = {
+    "out_datasets": "dataset_schema.json",
+    "outds_variables": "dataset_variable_schema.json",
+    "outds_endpoints": "dataset_endpoint_schema.json",
+    "outds_popuvar": "dataset_population_schema.json",
+    "outds_covar": "dataset_covariate_schema.json",
+    "outds_rspvar": "dataset_rspvar_schema.json",
+}
+
+# Columns of each metadata table, in catalog order
+FIELDS: Dict[str, Tuple[str, ...]] = {
+    "out_datasets": ("dataset_name", "dataset_label"),
+    "outds_variables": ("dataset_name", "variable_name", "variable_label"),
+    "outds_endpoints": ("dataset_name", "param", "paramcd"),
+    "outds_popuvar": ("dataset_name", "variable_name", "variable_label"),
+    "outds_covar": ("dataset_name", "variable_name", "variable_label"),
+    "outds_rspvar": ("dataset_name", "variable_name", "variable_label"),
+}
+
+STAMPS_FILE = "dataset_stamps.json"
+
+Stamps = Dict[str, Dict[str, Any]]
+Fetch = Callable[[List[str]], Mapping[str, Iterable[Dict[str, Any]]]]
+
+
+def _dump(data: Any, f: Any) -> None:
+    # Same layout as json.dump(data, f, indent=2), but lists are written row by row
+    if not isinstance(data, list):
+        json.dump(data, f, indent=2)
+        return
+    first = True
+    for row in data:
+        f.write("[\n" if first else ",\n")
+        f.write(textwrap.indent(json.dumps(row, indent=2), "  "))
+        first = False
+    f.write("[]" if first else "\n]")
+
+
+def write_atomic(path: Path, data: Any) -> bool:
+    """
+    Write JSON to `path` via a temporary file in the same directory and an atomic rename.
+    Returns False (and leaves `path` untouched) if the content is unchanged.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            _dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists() and filecmp.cmp(tmp, path, shallow=False):
+            os.unlink(tmp)
+            return False
+        os.replace(tmp, path)
+        return True
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _table_rows(path: Path, table: str) -> Iterator[Dict[str, Any]]:
+    fields = FIELDS[table]
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for record in csv.reader(f):
+            if record and record[0] == table:
+                # Missing SAS values arrive empty; pandas used to turn them into NaN
+                yield {field: value if value != "" else float("nan") for field, value in zip(fields, record[1:])}
+
+
+def read_bulk(path: Path) -> Dict[str, Iterable[Dict[str, Any]]]:
+    """
+    Lazy per-table row iterators over a bulk metadata export (see module docstring).
+    """
+    return {table: _table_rows(Path(path), table) for table in FIELDS}
+
+
+def _read(path: Path) -> Optional[Any]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def diff(previous: Stamps, current: Stamps) -> Dict[str, List[str]]:
+    """
+    Datasets added, modified (date or variable count moved) and removed since `previous`.
+    """
+    return {
+        "added": sorted(name for name in current if name not in previous),
+        "modified": sorted(name for name in current if name in previous and current[name] != previous[name]),
+        "removed": sorted(name for name in previous if name not in current),
+    }
+
+
+def merge(old_rows: Iterable[Dict[str, Any]], fresh_rows: Iterable[Dict[str, Any]],
+          replaced: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Drop the rows of `replaced` datasets, add the freshly pulled rows, keep rows grouped by dataset.
+    """
+    replaced = {name.upper() for name in replaced}
+    rows = [row for row in old_rows if str(row.get("dataset_name", "")).upper() not in replaced]
+    rows.extend(fresh_rows)
+    # Stable sort: rows keep their SAS order within a dataset
+    rows.sort(key=lambda row: str(row.get("dataset_name", "")).upper())
+    return rows
+
+
+def refresh(stamps: Stamps, fetch: Fetch, base: Path = catalog_store.BASE) -> Dict[str, Any]:
+    """
+    Bring the catalogs in `base` up to date with `stamps`; `fetch(datasets)` returns, per metadata
+    table, the rows of just those datasets. Returns a report of what changed.
+    """
+    base = Path(base)
+    previous = _read(base / STAMPS_FILE)
+    # Without a snapshot the existing catalogs cannot be trusted: rebuild them from scratch.
+    full = previous is None
+    changes = diff(previous or {}, stamps)
+    pulled = changes["added"] + changes["modified"]
+    replaced = set(pulled + changes["removed"])
+
+    written: List[str] = []
+    if replaced:
+        fresh = fetch(pulled) if pulled else {}
+        for table, name in CATALOGS.items():
+            old_rows = [] if full else _read(base / name) or []
+            if write_atomic(base / name, merge(old_rows, fresh.get(table, ()), replaced)):
+                written.append(name)
+    if replaced or full:
+        write_atomic(base / STAMPS_FILE, stamps)
+
+    changes.update(unchanged=len(stamps) - len(pulled), full=full, written=written)
+    return changes
@@ -0,0 +1,135 @@
+"""
+Shared in-process cache for the JSON catalogs under `schema/`.
+
+Each catalog is parsed once per process and reloaded only when the file on disk
+changes. A change is detected from the file's mtime/size stamp; when the stamp
+moves but the content hash is unchanged (e.g. the file was touched or rewritten
+with identical content) the cached object is kept. Both the legacy
+`BiostatChatbot` flow and the ADK tools read catalogs through this module.
+
+Cached objects are shared between callers and must be treated as read-only.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+BASE = Path(__file__).resolve().parent / "schema"
+
+def normalize(value: Any) -> str:
+    """
+    Case-insensitive, whitespace-normalized lookup key.
+    """
+    return " ".join(str(value).split()).casefold()
+
+
+class _Entry:
+    __slots__ = ("stamp", "digest", "data", "version")
+
+    def __init__(self, stamp: Tuple[int, int], digest: str, data: Any, version: int) -> None:
+        self.stamp = stamp
+        self.digest = digest
+        self.data = data
+        self.version = version
+
+
+class CatalogStore:
+    """
+    Process-wide catalog cache keyed by file name relative to `base`.
+    """
+
+    def __init__(self, base: Path = BASE) -> None:
+        self.base = Path(base)
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self, path: Path) -> Tuple[int, int]:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _entry(self, name: str) -> _Entry:
+        path = self.base / name
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.stamp == stamp:
+                self.hits += 1
+                return entry
+
+            with open(path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry is not None and entry.digest == digest:
+                # Touched but unchanged: keep the parsed object.
+                entry.stamp = stamp
+                self.hits += 1
+                return entry
+
+            version = entry.version + 1 if entry is not None else 1
+            entry = _Entry(stamp, digest, json.loads(raw), version)
+            self._entries[name] = entry
+            self.misses += 1
+            return entry
+
+    def load(self, name: str) -> Any:
+        """
+        Return the parsed catalog `name` (e.g. "dataset_endpoint_schema.json").
+        """
+        return self._entry(name).data
+
+    def version(self, name: str) -> int:
+        """
+        Return a counter that increases every time `name` is re-parsed with new content.
+        """
+        return self._entry(name).version
+
+    def digest(self, name: str) -> str:
+        """
+        Return the SHA-256 of the catalog file's current content (stable across processes).
+        """
+        return self._entry(name).digest
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Drop one cached catalog, or all of them when `name` is None.
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return hit/miss counters and the catalogs currently cached.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "catalogs": {name: e.version for name, e in self._entries.items()},
+            }
+
+
+store = CatalogStore()
+
+
+def load(name: str) -> Any:
+    return store.load(name)
+
+
+def version(name: str) -> int:
+    return store.version(name)
+
+
+def digest(name: str) -> str:
+    return store.digest(name)
+
+
+def stats() -> Dict[str, Any]:
+    return store.stats()
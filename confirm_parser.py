@@ -0,0 +1,170 @@
+"""
+Deterministic parser for the reply to "shall I run the analysis?".
+
+Once every parameter is filled, `BiostatChatbot.update_info` has to decide
+whether the user confirmed ("yes", "y", "go ahead"), declined ("no") or asked
+to change parameters ("no, change the population to ITT", "use CHG"). Most
+replies are one word, so they are classified here from word lists, parameter
+names (and their camel-case parts, e.g. "response variable") and catalog codes
+found by `slot_matcher`. Only replies the rules cannot decide go to the LLM.
+"""
+
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import slot_matcher
+
+CONFIRM = "confirm"
+DECLINE = "decline"
+UPDATE = "update"
+
+_AFFIRMATIVE = frozenset({
+    "y", "yes", "yeah", "yep", "yup", "ya", "sure", "ok", "okay", "k", "confirm", "confirmed", "correct",
+    "proceed", "go", "ahead", "run", "execute", "start", "good", "fine", "great", "perfect", "right",
+    "lgtm", "agreed", "agree", "absolutely", "definitely", "affirmative",
+})
+_NEGATIVE = frozenset({"n", "no", "nope", "nah", "not", "don't", "dont", "wait", "hold", "cancel", "stop", "wrong"})
+_CHANGE = frozenset({"change", "update", "modify", "switch", "replace", "instead", "use", "set", "edit", "rather"})
+# Words that carry no intent of their own ("yes please run it", "looks good to me, thanks")
+_FILLER = frozenset({
+    "please", "it", "the", "analysis", "that", "this", "is", "looks", "look", "sounds", "all", "to", "me", "thanks",
+    "thank", "you", "do", "let's", "lets", "us", "now", "on", "a", "an", "and", "with", "for", "of", "just",
+    "i", "am", "i'm", "we", "are", "so", "well", "very", "much", "everything", "ready", "there", "model",
+})
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_CAMEL_RE = re.compile(r"(?<!^)(?=[A-Z])")
+
+# Extra ways users refer to parameters, beyond the parameter name itself
+ALIASES: Dict[str, Tuple[str, ...]] = {
+    "Endpoint": ("paramcd", "end point"),
+    "Population": ("analysis set", "pop"),
+    "ResponseVariable": ("response", "dependent variable", "outcome variable"),
+    "Covariate": ("covariates",),
+    "CovarianceMatrix": ("covariance", "covariance structure"),
+    "CIMethod": ("ci method", "confidence interval method"),
+    "StratificationVariable": ("stratification", "strata", "stratum"),
+}
+
+
+def words(text: str) -> List[str]:
+    return _WORD_RE.findall(str(text).lower())
+
+
+def _phrases(param: str) -> List[Tuple[str, ...]]:
+    spelled = _CAMEL_RE.sub(" ", param)
+    phrases = {tuple(words(param)), tuple(words(spelled))}
+    phrases.update(tuple(words(alias)) for alias in ALIASES.get(param, ()))
+    return sorted((p for p in phrases if p), key=len, reverse=True)
+
+
+class Confirmation(NamedTuple):
+    intent: str
+    # Parameters to change -> new catalog value, or None when the reply names the parameter but no value
+    updates: Dict[str, Optional[str]]
+
+
+class ConfirmationParser:
+    """
+    Rule-based confirm/decline/update classifier. Counts how often the rules decided versus the LLM.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.llm_fallback = 0
+
+    def mentions(self, tokens: Sequence[str], params: Sequence[str]) -> List[Tuple[int, int, str]]:
+        """
+        (start, end, param) of every parameter named in `tokens`, in order of appearance.
+        """
+        found: List[Tuple[int, int, str]] = []
+        taken: Set[int] = set()
+        for param in params:
+            for phrase in _phrases(param):
+                n = len(phrase)
+                for i in range(len(tokens) - n + 1):
+                    span = set(range(i, i + n))
+                    if tuple(tokens[i:i + n]) == phrase and not span & taken:
+                        found.append((i, i + n, param))
+                        taken |= span
+        found.sort()
+        return found
+
+    def _updates(self, tokens: List[str], mentions: List[Tuple[int, int, str]]) -> Dict[str, Optional[str]]:
+        updates: Dict[str, Optional[str]] = {}
+        for n, (_, end, param) in enumerate(mentions):
+            # The new value follows the parameter name, up to the next parameter name
+            stop = mentions[n + 1][0] if n + 1 < len(mentions) else len(tokens)
+            segment = " ".join(tokens[end:stop])
+            value = slot_matcher.match(param, segment).value if segment else None
+            if updates.get(param) is None:
+                updates[param] = value
+        return updates
+
+    def _codes(self, text: str, params: Sequence[str]) -> Dict[str, Optional[str]]:
+        # Catalog codes typed without a parameter name ("use CHG"); only an unambiguous single hit counts
+        hits = []
+        for param in params:
+            codes = {c.code for c in slot_matcher.matcher.rank(param, text) if c.reason == "code"}
+            hits.extend((param, code) for code in codes)
+        return {hits[0][0]: hits[0][1]} if len(hits) == 1 else {}
+
+    def parse(self, text: str, params: Sequence[str]) -> Optional[Confirmation]:
+        """
+        Classify the reply, or return None when the rules cannot decide (use the LLM).
+        """
+        result = self._parse(text, list(params or ()))
+        with self._lock:
+            if result is not None:
+                self.fast_path += 1
+            else:
+                self.llm_fallback += 1
+        return result
+
+    def _parse(self, text: str, params: List[str]) -> Optional[Confirmation]:
+        tokens = words(text)
+        if not tokens:
+            return None
+        vocabulary = set(tokens)
+        affirmative = bool(vocabulary & _AFFIRMATIVE)
+        negative = bool(vocabulary & _NEGATIVE)
+        change = bool(vocabulary & _CHANGE)
+
+        mentions = self.mentions(tokens, params)
+        if mentions:
+            updates = self._updates(tokens, mentions)
+            # "yes, the population is right" names a parameter without asking for a change
+            if change or negative or any(value is not None for value in updates.values()):
+                return Confirmation(UPDATE, updates)
+            return None
+
+        if not affirmative:
+            codes = self._codes(text, params)
+            if codes:
+                return Confirmation(UPDATE, codes)
+
+        unexplained = vocabulary - _AFFIRMATIVE - _NEGATIVE - _FILLER
+        if unexplained:
+            return None
+        if affirmative and not negative:
+            return Confirmation(CONFIRM, {})
+        if negative and not affirmative:
+            return Confirmation(DECLINE, {})
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"fast_path": self.fast_path, "llm_fallback": self.llm_fallback}
+
+
+parser = ConfirmationParser()
+
+
+def parse(text: str, params: Sequence[str]) -> Optional[Confirmation]:
+    return parser.parse(text, params)
+
+
+def stats() -> Dict[str, int]:
+    return parser.stats()
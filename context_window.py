@@ -0,0 +1,80 @@
+"""
+Bounded, token-budgeted view of the chat history for LLM calls.
+
+`BiostatChatbot.chat_history` keeps every message (and is what the log sinks
+write), but sending all of it on every call makes prompts grow with each turn,
+largely because of prompts that embed whole catalogs. `ContextWindow.build`
+returns the messages to send instead:
+
+- the leading system prompt(s),
+- the current `analysis_detail` as a short system message,
+- the last N turns, where long messages other than the current prompt are
+  shortened to a summary,
+- trimmed from the oldest turn until the estimated token count fits the budget.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from message_store import Message
+
+MAX_TOKENS = int(os.getenv("LLM_CONTEXT_MAX_TOKENS", "8000"))
+KEEP_TURNS = int(os.getenv("LLM_CONTEXT_KEEP_TURNS", "6"))
+SUMMARY_TOKENS = int(os.getenv("LLM_CONTEXT_SUMMARY_TOKENS", "200"))
+
+# Rough average for English text and JSON; good enough to bound prompt size.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def summarize(content: str, max_tokens: int = SUMMARY_TOKENS) -> str:
+    """
+    Shorten a long message to its opening text plus a note of what was omitted.
+    """
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(content) <= limit:
+        return content
+    omitted = estimate_tokens(content[limit:])
+    return f"{content[:limit].rstrip()} ... [~{omitted} tokens omitted]"
+
+
+class ContextWindow:
+
+    def __init__(self, max_tokens: int = MAX_TOKENS, keep_turns: int = KEEP_TURNS,
+                 summary_tokens: int = SUMMARY_TOKENS) -> None:
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self._detail: Optional[Message] = None
+
+    def _detail_message(self, analysis_detail: Dict[str, Any]) -> Message:
+        # Reuse the record while the detail is unchanged so its rendering stays cached.
+        content = f"Current analysis detail: {analysis_detail}"
+        if self._detail is None or self._detail.content != content:
+            self._detail = Message("system", content)
+        return self._detail
+
+    def build(self, history: Sequence[Message], analysis_detail: Optional[Dict[str, Any]] = None
+              ) -> List[Message]:
+        """
+        Return the messages to send for the latest entry in `history`.
+        """
+        n_system = 0
+        while n_system < len(history) and history[n_system].role == "system":
+            n_system += 1
+        head = list(history[:n_system])
+        if analysis_detail is not None:
+            head.append(self._detail_message(analysis_detail))
+
+        # One turn is a user prompt and the assistant reply.
+        recent = history[n_system:][-max(self.keep_turns * 2, 1):]
+        body = [m.shortened(self.summary_tokens, summarize) for m in recent[:-1]] + list(recent[-1:])
+
+        used = sum(estimate_tokens(m.content) for m in head + body)
+        while len(body) > 1 and used > self.max_tokens:
+            used -= estimate_tokens(body.pop(0).content)
+
+        return head + body
@@ -17,10 +17,46 @@ VALUES (1, 1, 'System', 'Test1'),
        (1, 2, 'User', 'Test2'),
        (1, 3, 'Assistant', 'Test3');
 
--- CREATE TABLE data_library ();
--- CREATE TABLE data_list ();
--- CREATE TABLE data_vars ();
--- CREATE TABLE data_param ();
+-----------------------------------------------------------------
+-- TABLES: DATA CATALOG (SQLite implementation in catalog_db.py) --
+-----------------------------------------------------------------
+CREATE TABLE data_library (
+    library_id   INT NOT NULL PRIMARY KEY,
+    name         VARCHAR(100) NOT NULL UNIQUE,
+    path         VARCHAR(500),
+    refreshed_at TIMESTAMP
+);
+
+CREATE TABLE data_list (
+    library_id    INT NOT NULL,
+    seq           INT NOT NULL,
+    dataset_name  VARCHAR(32) NOT NULL,
+    dataset_label VARCHAR(256),
+    modified      VARCHAR(20),
+    nvar          INT
+);
+CREATE INDEX data_list_name ON data_list (library_id, dataset_name);
+
+CREATE TABLE data_vars (
+    library_id     INT NOT NULL,
+    role           VARCHAR(20) NOT NULL, -- variable, population, covariate, response
+    seq            INT NOT NULL,
+    dataset_name   VARCHAR(32) NOT NULL,
+    variable_name  VARCHAR(32) NOT NULL,
+    variable_label VARCHAR(256)
+);
+CREATE INDEX data_vars_name ON data_vars (library_id, role, variable_name);
+CREATE INDEX data_vars_dataset ON data_vars (library_id, role, dataset_name);
+
+CREATE TABLE data_param (
+    library_id   INT NOT NULL,
+    seq          INT NOT NULL,
+    dataset_name VARCHAR(32) NOT NULL,
+    param        VARCHAR(200),
+    paramcd      VARCHAR(8) NOT NULL
+);
+CREATE INDEX data_param_code ON data_param (library_id, paramcd);
+CREATE INDEX data_param_dataset ON data_param (library_id, dataset_name);
 
 ------------------------
 -- TABLE: STAT_METHOD --
@@ -0,0 +1,119 @@
+"""
+Deterministic keyword classifier for the analysis method.
+
+Matches the user's message against the `AnalysisMethod` names and the
+`AnalysisKeyword` lists in `standard_analysis_schema.json` (token n-grams, so
+"time to event" and "Kaplan-Meier" match as phrases). When exactly one method
+clearly wins, the caller can skip the LLM round trip; otherwise it falls back
+to the LLM prompt.
+"""
+
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import catalog_store
+
+STANDARD_SCHEMA = "standard_analysis_schema.json"
+MIN_CONFIDENCE = float(os.getenv("INTENT_FAST_PATH_MIN_CONFIDENCE", "0.75"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+class IntentMatch(NamedTuple):
+    method: str
+    confidence: float
+    scores: Dict[str, int]
+
+
+class _KeywordIndex:
+    """
+    n-gram (tuple of tokens) -> analysis methods it identifies.
+    """
+
+    def __init__(self, standard_schema: List[dict]) -> None:
+        self.ngrams: Dict[Tuple[str, ...], Set[str]] = {}
+        for analysis in standard_schema:
+            method = analysis["AnalysisMethod"]
+            for phrase in [method] + list(analysis.get("AnalysisKeyword", [])):
+                gram = tuple(tokenize(phrase))
+                if gram:
+                    self.ngrams.setdefault(gram, set()).add(method)
+        self.max_n = max((len(g) for g in self.ngrams), default=0)
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """
+        Score each method by the number of input tokens covered by its keywords.
+        """
+        tokens = tokenize(text)
+        scores: Dict[str, int] = {}
+        for i in range(len(tokens)):
+            for n in range(1, min(self.max_n, len(tokens) - i) + 1):
+                for method in self.ngrams.get(tuple(tokens[i:i + n]), ()):
+                    scores[method] = scores.get(method, 0) + n
+        return scores
+
+
+class IntentClassifier:
+    """
+    Keyword classifier rebuilt whenever the standard analysis catalog changes.
+    Counts how often the fast path answered versus how often the LLM was needed.
+    """
+
+    def __init__(self, min_confidence: float = MIN_CONFIDENCE) -> None:
+        self.min_confidence = min_confidence
+        self._index: Optional[_KeywordIndex] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.llm_fallback = 0
+
+    def _keyword_index(self) -> _KeywordIndex:
+        version = catalog_store.version(STANDARD_SCHEMA)
+        if self._index is None or self._version != version:
+            self._index = _KeywordIndex(catalog_store.load(STANDARD_SCHEMA))
+            self._version = version
+        return self._index
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        """
+        Return the best-scoring method with its confidence (share of the total score), or None.
+        """
+        scores = self._keyword_index().scores(text)
+        if not scores:
+            return None
+        method = max(scores, key=scores.get)
+        return IntentMatch(method, scores[method] / sum(scores.values()), scores)
+
+    def classify(self, text: str) -> Optional[str]:
+        """
+        Return the AnalysisMethod when the match is unambiguous, else None (use the LLM).
+        """
+        result = self.match(text)
+        confident = result is not None and result.confidence >= self.min_confidence
+        with self._lock:
+            if confident:
+                self.fast_path += 1
+            else:
+                self.llm_fallback += 1
+        return result.method if confident else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"fast_path": self.fast_path, "llm_fallback": self.llm_fallback}
+
+
+classifier = IntentClassifier()
+
+
+def classify(text: str) -> Optional[str]:
+    return classifier.classify(text)
+
+
+def stats() -> Dict[str, int]:
+    return classifier.stats()
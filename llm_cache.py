@@ -0,0 +1,161 @@
+"""
+Cache of LLM replies to deterministic, classification-style prompts.
+
+Prompts such as "which analysis is the user requesting" or "which of these
+options did the user pick" get the same answer for the same user phrase, so
+`BiostatChatbot` keys them by model name, a template ID and the inputs that
+fill the template (the user's text, normalized, and the option list or catalog
+digest) -- never by the free-form chat history. Recent entries are kept in an
+in-memory LRU in front of a SQLite table with a TTL and an entry limit; hits
+from SQLite are promoted to memory. Conversational prompts (`ask_for_info`)
+are not cached.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+DB_PATH = os.getenv("LLM_CACHE_DB_PATH", os.getenv("ADK_DB_PATH", "adk.db"))
+TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+
+
+def normalize(text: str) -> str:
+    """
+    Case- and whitespace-insensitive form of a user phrase ("Yes " and "yes" share an entry).
+    """
+    return " ".join(str(text).split()).casefold()
+
+
+def key(model_name: str, template: str, inputs: Mapping[str, Any]) -> str:
+    """
+    SHA-256 of the model, template ID and template inputs; string inputs are normalized.
+    """
+    canonical = {
+        "model": model_name,
+        "template": template,
+        "inputs": {k: normalize(v) if isinstance(v, str) else v for k, v in inputs.items()},
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+
+    def __init__(self, db_path: str = DB_PATH, ttl: float = TTL, max_entries: int = MAX_ENTRIES,
+                 memory_entries: int = MEMORY_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    template TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_hit REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_hit ON llm_cache(last_hit)")
+            self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        Cached reply for `cache_key`, or None if missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._memory.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self._memory.pop(cache_key, None)
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_hit = ? WHERE cache_key = ?", (now, cache_key))
+            self._conn.commit()
+            self._remember(cache_key, row[0], row[1])
+            self.hits += 1
+            return row[0]
+
+    def put(self, cache_key: str, response: str, template: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(cache_key, template, response, created_at, last_hit) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cache_key, template, response, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+            self._remember(cache_key, response, now)
+
+    def _remember(self, cache_key: str, response: str, created_at: float) -> None:
+        # Called with the lock held.
+        self._memory[cache_key] = (response, created_at)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float) -> None:
+        # Called with the lock held.
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE cache_key NOT IN "
+            "(SELECT cache_key FROM llm_cache ORDER BY last_hit DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM llm_cache").fetchone()[0]
+            memory = len(self._memory)
+        return {"entries": entries, "memory": memory, "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache() -> LLMCache:
+    """
+    The process-wide LLM response cache, created on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def get(cache_key: str) -> Optional[str]:
+    return cache().get(cache_key)
+
+
+def put(cache_key: str, response: str, template: str = "") -> None:
+    cache().put(cache_key, response, template)
+
+
+def stats() -> Dict[str, int]:
+    return cache().stats()
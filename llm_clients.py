@@ -0,0 +1,230 @@
+"""
+Process-wide LLM clients.
+
+Every `BiostatChatbot` (one per browser session) used to build its own Groq
+client, and `GeminiClient` called `genai.configure` per instance, so sessions
+paid connection setup again and again. Clients now come from this module:
+
+- Groq: one client per API key, backed by a shared `httpx.Client` keep-alive
+  pool (HTTP/2 when the `h2` package is installed), with configurable pool
+  size, timeout and retries.
+- Gemini: `genai.configure` runs once per process; the SDK's gRPC channel
+  (HTTP/2) is shared by one `GenerativeModel` per model name. The per-chatbot
+  `GeminiClient` adapter wraps the shared model.
+- mock: a local stand-in that answers with a canned reply after a fixed
+  latency, for benchmarks and tests without network access.
+
+Each provider has a concurrency limit; requests beyond it wait for a slot
+instead of opening more connections than the pool holds.
+"""
+
+import importlib.util
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, Optional
+
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+KEEPALIVE = float(os.getenv("LLM_KEEPALIVE", "120"))
+HTTP2 = os.getenv("LLM_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+# "mock" routes every chatbot to MockClient regardless of the model name
+PROVIDER = os.getenv("LLM_PROVIDER", "")
+GROQ_MODELS = {"llama3-70b-8192"}
+MOCK_REPLY = os.getenv("LLM_MOCK_REPLY", "OK")
+MOCK_LATENCY = float(os.getenv("LLM_MOCK_LATENCY", "0.05"))
+
+
+def max_concurrency(provider: str) -> int:
+    """
+    Concurrent requests allowed for `provider` (LLM_<PROVIDER>_MAX_CONCURRENCY, default LLM_POOL_SIZE); 0 is unlimited.
+    """
+    return int(os.getenv(f"LLM_{provider.upper()}_MAX_CONCURRENCY", str(POOL_SIZE)))
+
+
+def provider(model_name: str) -> str:
+    if PROVIDER:
+        return PROVIDER
+    if model_name == "mock":
+        return "mock"
+    return "groq" if model_name in GROQ_MODELS else "gemini"
+
+
+class Limiter:
+    """
+    Caps the requests in flight for one provider. A streamed response holds its slot until it is consumed.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit) if limit > 0 else None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    def _acquire(self) -> None:
+        if self._slots is not None:
+            self._slots.acquire()
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.active -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self._acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        if not kwargs.get("stream"):
+            self._release()
+            return result
+        return self._drain(result)
+
+    def _drain(self, stream: Any) -> Iterator[Any]:
+        try:
+            yield from stream
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"limit": self.limit, "calls": self.calls, "active": self.active, "peak": self.peak}
+
+
+class _Completions:
+    def __init__(self, create: Callable[..., Any], limiter: Limiter) -> None:
+        self._create = create
+        self._limiter = limiter
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._limiter.call(self._create, **kwargs)
+
+
+class LimitedClient:
+    """
+    `.chat.completions.create` of a shared client, behind the provider's concurrency limit.
+    """
+
+    def __init__(self, client: Any, limiter: Limiter) -> None:
+        self.client = client
+        self.chat = SimpleNamespace(completions=_Completions(client.chat.completions.create, limiter))
+
+
+class MockClient:
+    """
+    Local stand-in for an OpenAI-style client: waits `latency` seconds and answers `reply`
+    (or "{}" when JSON is requested); streamed replies arrive word by word over the same time.
+    """
+
+    def __init__(self, reply: str = MOCK_REPLY, latency: float = MOCK_LATENCY) -> None:
+        self.reply = reply
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=_Completions(self.create, limiter("mock")))
+
+    def create(self, messages: Any = None, model: Optional[str] = None, response_format: Optional[dict] = None,
+               stream: bool = False, **_: Any) -> Any:
+        json_mode = bool(response_format) and response_format.get("type") in {"json_object", "json_schema"}
+        content = "{}" if json_mode else self.reply
+        if stream:
+            return self._stream(content)
+        time.sleep(self.latency)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def _stream(self, content: str) -> Iterator[Any]:
+        pieces = content.split(" ")
+        for n, piece in enumerate(pieces):
+            time.sleep(self.latency / len(pieces))
+            text = piece if n == 0 else f" {piece}"
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+_lock = threading.Lock()
+_limiters: Dict[str, Limiter] = {}
+_groq: Dict[str, LimitedClient] = {}
+_gemini_models: Dict[str, Any] = {}
+_gemini_key: Optional[str] = None
+
+
+def limiter(provider_name: str) -> Limiter:
+    with _lock:
+        found = _limiters.get(provider_name)
+        if found is None:
+            found = _limiters[provider_name] = Limiter(max_concurrency(provider_name))
+        return found
+
+
+def groq_client(api_key: Optional[str]) -> LimitedClient:
+    """
+    The shared Groq client for `api_key`, created on first use.
+    """
+    with _lock:
+        client = _groq.get(api_key or "")
+    if client is not None:
+        return client
+    import httpx
+    from groq import Groq
+
+    http_client = httpx.Client(
+        http2=HTTP2,
+        timeout=TIMEOUT,
+        limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE,
+                            keepalive_expiry=KEEPALIVE),
+    )
+    created = LimitedClient(Groq(api_key=api_key, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                                 http_client=http_client), limiter("groq"))
+    with _lock:
+        # Another thread may have won the race; keep the first client and drop this one's pool
+        client = _groq.setdefault(api_key or "", created)
+    if client is not created:
+        http_client.close()
+    return client
+
+
+def gemini_model(api_key: Optional[str], model_name: str) -> Any:
+    """
+    The shared `GenerativeModel` for `model_name`; configures the SDK once per process (and again only if the key changes).
+    """
+    global _gemini_key
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY is required")
+    import google.generativeai as genai
+
+    with _lock:
+        if _gemini_key != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_key = api_key
+            _gemini_models.clear()
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = _gemini_models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+def request_options() -> Dict[str, float]:
+    """
+    Per-request options for Gemini `generate_content` (the SDK has no client-wide timeout).
+    """
+    return {"timeout": TIMEOUT}
+
+
+def mock_client() -> MockClient:
+    return MockClient()
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        limiters = dict(_limiters)
+        clients = {"groq": len(_groq), "gemini_models": len(_gemini_models)}
+    clients.update({name: found.stats() for name, found in limiters.items()})
+    return clients
@@ -0,0 +1,101 @@
+"""
+Compact, append-only chat history.
+
+Messages are `__slots__` records with interned role strings. Each record caches
+its rendered "ROLE: content" line (and its shortened summary for the context
+window), so prompts are assembled from cached pieces instead of being
+re-formatted on every LLM call. Records support `msg["role"]` /
+`msg["content"]` so code written against the old list-of-dicts keeps working.
+"""
+
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+_ROLE_PREFIXES: Dict[str, str] = {}
+
+
+def _role_prefix(role: str) -> str:
+    prefix = _ROLE_PREFIXES.get(role)
+    if prefix is None:
+        prefix = _ROLE_PREFIXES.setdefault(role, f"{role.upper()}: ")
+    return prefix
+
+
+class Message:
+    __slots__ = ("role", "content", "_rendered", "_summary")
+
+    def __init__(self, role: str, content: str) -> None:
+        self.role = sys.intern(role)
+        self.content = content
+        self._rendered: Optional[str] = None
+        self._summary: Optional[Tuple[int, "Message"]] = None
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def __repr__(self) -> str:
+        return repr(self.as_dict())
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    @property
+    def rendered(self) -> str:
+        """
+        The "ROLE: content" line used by the Gemini prompt adapter.
+        """
+        if self._rendered is None:
+            self._rendered = _role_prefix(self.role) + self.content
+        return self._rendered
+
+    def shortened(self, max_tokens: int, shorten: Callable[[str, int], str]) -> "Message":
+        """
+        Return this message with its content passed through `shorten`, cached per `max_tokens`.
+        """
+        if self._summary is None or self._summary[0] != max_tokens:
+            content = shorten(self.content, max_tokens)
+            self._summary = (max_tokens, self if content == self.content else Message(self.role, content))
+        return self._summary[1]
+
+
+def render(message: Union[Message, Dict[str, str]]) -> str:
+    if isinstance(message, Message):
+        return message.rendered
+    return _role_prefix(message["role"]) + message["content"]
+
+
+class MessageStore:
+    """
+    Append-only sequence of `Message` records.
+    """
+
+    __slots__ = ("_messages",)
+
+    def __init__(self, messages: Optional[List[Union[Message, Dict[str, str]]]] = None) -> None:
+        self._messages: List[Message] = []
+        for m in messages or []:
+            self.append(m["role"], m["content"])
+
+    def append(self, role: str, content: str) -> Message:
+        message = Message(role, content)
+        self._messages.append(message)
+        return message
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def __repr__(self) -> str:
+        return repr(self._messages)
+
+    def as_dicts(self) -> List[Dict[str, str]]:
+        return [m.as_dict() for m in self._messages]
@@ -1,7 +1,14 @@
 import asyncio
+import concurrent.futures
+import queue
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple
 
+import async_runtime
+import prompt_templates
+import sas_jobs
 from BiostatChatbot import BiostatChatbot, GEMINI_API_KEY
 from adk_runtime import ADKOrchestratorClient
+from session_manager import SessionManager
 
 
 class OrchestratorAgent:
@@ -11,23 +18,130 @@ class OrchestratorAgent:
     """
 
     def __init__(self, model_name: str = "gemini-1.5-flash", user_name: str = "songgu.xie"):
+        self.model_name = model_name
+        self.user_name = user_name
         self.adk_client = ADKOrchestratorClient()
+        # Render the stable prompt prefixes once at startup rather than on the first request of each kind
+        prompt_templates.warm()
         self.core = BiostatChatbot(api_key=GEMINI_API_KEY, model_name=model_name, user_name=user_name)
+        self.sessions = SessionManager(self._new_chatbot)
 
-    def handle_message(self, user_input: str) -> str:
+    def _new_chatbot(self, session_id: str) -> BiostatChatbot:
+        return BiostatChatbot(
+            api_key=GEMINI_API_KEY, model_name=self.model_name, user_name=self.user_name, session_id=session_id
+        )
+
+    def handle_message(self, user_input: str, session_id: Optional[str] = None) -> str:
+        """
+        Synchronous entry point: runs `handle_message_async` on the shared event loop.
+        """
+        return async_runtime.run(self.handle_message_async(user_input, session_id=session_id))
+
+    def submit_message(self, user_input: str, session_id: Optional[str] = None,
+                       on_token: Optional[Callable[[str], None]] = None) -> "concurrent.futures.Future[str]":
+        """
+        Schedule a message on the shared event loop and return a future for the reply.
         """
-        Single entry point used by the Flask endpoint. Uses ADK agent graph
-        when configured; otherwise mirrors the prior local control flow.
+        return async_runtime.submit(self.handle_message_async(user_input, session_id=session_id, on_token=on_token))
+
+    def stream_message(self, user_input: str, session_id: Optional[str] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Run a message on the shared event loop and yield ("token", text) pieces of the reply as the
+        LLM generates them, then ("done", reply) with the complete reply. Replies that do not come
+        from a streamed LLM call (job status, ADK) arrive as the final event only. Pieces that queue
+        up while the consumer is busy are merged into one event.
+        """
+        tokens: "queue.Queue[Optional[str]]" = queue.Queue()
+        future = self.submit_message(user_input, session_id=session_id, on_token=tokens.put)
+        future.add_done_callback(lambda _: tokens.put(None))
+        finished = False
+        while not finished:
+            pieces = [tokens.get()]
+            while not tokens.empty():
+                pieces.append(tokens.get_nowait())
+            if pieces[-1] is None:
+                finished = True
+                pieces.pop()
+            if pieces:
+                yield "token", "".join(pieces)
+        yield "done", future.result()
+
+    async def reply(self, user_input: str, session_id: Optional[str] = None) -> str:
+        """
+        Await the reply from another event loop (the ASGI server's) without holding a thread while
+        the message runs on the shared loop.
+        """
+        return await asyncio.wrap_future(self.submit_message(user_input, session_id=session_id))
+
+    async def stream_message_async(self, user_input: str,
+                                   session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        `stream_message` for callers on another event loop (the ASGI server's): the same events,
+        awaited instead of blocking a thread between pieces.
+        """
+        loop = asyncio.get_running_loop()
+        tokens: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        reply = asyncio.wrap_future(self.submit_message(
+            user_input, session_id=session_id, on_token=lambda text: loop.call_soon_threadsafe(tokens.put_nowait, text)
+        ))
+        reply.add_done_callback(lambda _: tokens.put_nowait(None))
+        finished = False
+        while not finished:
+            pieces = [await tokens.get()]
+            while not tokens.empty():
+                pieces.append(tokens.get_nowait())
+            if pieces[-1] is None:
+                finished = True
+                pieces.pop()
+            if pieces:
+                yield "token", "".join(pieces)
+        yield "done", await reply
+
+    async def handle_message_async(self, user_input: str, session_id: Optional[str] = None,
+                                   on_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Single entry point used by the web endpoints. Uses ADK agent graph
+        when configured; otherwise mirrors the prior local control flow on the
+        chatbot for `session_id` (the shared `core` chatbot when no session is given).
+
+        Runs on the shared event loop; the blocking local flow is offloaded to the bounded executor.
+        `on_token` receives the user-facing reply as it is generated (local flow only).
         """
         if self.adk_client.configured:
             try:
-                return asyncio.run(self.adk_client.send_message(user_input))
+                return await self.adk_client.send_message(user_input, session_id=session_id)
             except NotImplementedError:
                 pass
             except RuntimeError:
                 pass
 
-        bot = self.core
+        return await async_runtime.to_thread(self._handle_session, user_input, session_id, on_token)
+
+    def _handle_session(self, user_input: str, session_id: Optional[str],
+                        on_token: Optional[Callable[[str], None]] = None) -> str:
+        if session_id is None:
+            return self._handle_streaming(self.core, user_input, on_token)
+        with self.sessions.session(session_id) as bot:
+            return self._handle_streaming(bot, user_input, on_token)
+
+    def _handle_streaming(self, bot: BiostatChatbot, user_input: str,
+                          on_token: Optional[Callable[[str], None]]) -> str:
+        bot.token_sink = on_token
+        try:
+            return self._handle_local(bot, user_input)
+        finally:
+            bot.token_sink = None
+
+    def _handle_local(self, bot: BiostatChatbot, user_input: str) -> str:
+        if bot.job_id is not None:
+            # Analysis already submitted: report on the job instead of re-running it
+            job = sas_jobs.queue().get(bot.job_id)
+            response = bot.present_job(job)
+            if job is None or job["status"] in (sas_jobs.SUCCEEDED, sas_jobs.FAILED):
+                # The job is over (or its record is gone): the next message starts a new analysis
+                bot.reset_analysis()
+            return response
+
         if bot.analysis_detail is None:
             analysis_name = bot.find_stat_method(user_input)
             bot.set_analysis(analysis_name)
@@ -38,7 +152,8 @@ class OrchestratorAgent:
             _, ask_for = bot.filter_response(user_input)
 
         if bot.confirm_proceed:
-            url = bot.execute_analysis()
-            return bot.present_output(url)
+            jobs = sas_jobs.queue()
+            bot.job_id = jobs.enqueue(bot.analysis_detail, session_id=bot.session_id)
+            return bot.present_job(jobs.get(bot.job_id))
 
         return bot.ask_for_info(ask_for)
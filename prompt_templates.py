@@ -0,0 +1,235 @@
+"""
+Registry of the LLM prompt templates used by `BiostatChatbot`.
+
+Every prompt is split into a stable prefix (instructions, and catalog text such
+as the analysis schemas) and a per-turn suffix (the user's words, current
+analysis detail, options). Templates are parsed once at import; a prefix is
+rendered once per prefix arguments and catalog version and then reused as the
+same string, so large schema text is not re-formatted on every call. The
+prefix is sent ahead of the chat history and only the suffix enters the chat
+history; `BiostatChatbot.stable_prefix` keeps sending the current analysis
+schema (the `set_analysis` prefix) with every later prompt of the analysis.
+The prefixes (a few hundred tokens) are far below the minimum size of Gemini
+context caching, so they are sent inline rather than cached on the provider.
+"""
+
+import string
+import threading
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import catalog_store
+
+STANDARD_SCHEMA = "standard_analysis_schema.json"
+ANALYSIS_SCHEMAS = {
+    "ANCOVA": "ancova1_analysis_schema.json",
+    "BINARY": "binary1_analysis_schema.json",
+    "TTE": "tte1_analysis_schema.json",
+    "MMRM": "mmrm1_analysis_schema.json",
+}
+
+
+def analysis_schema_file(analysis_name: str) -> str:
+    # Unknown methods fall back to MMRM, as set_analysis always has
+    return ANALYSIS_SCHEMAS.get(analysis_name, ANALYSIS_SCHEMAS["MMRM"])
+
+
+class Prompt(NamedTuple):
+    template: str
+    prefix: str
+    suffix: str
+
+    def __str__(self) -> str:
+        return f"{self.prefix}\n{self.suffix}" if self.prefix and self.suffix else self.prefix or self.suffix
+
+
+def _compile(text: str) -> List[Tuple[str, Optional[str]]]:
+    pieces = []
+    for literal, field, spec, conversion in string.Formatter().parse(text):
+        if spec or conversion:
+            raise ValueError(f"format specs are not supported in prompt templates: {{{field}!{conversion}:{spec}}}")
+        pieces.append((literal, field))
+    return pieces
+
+
+def _render(pieces: Sequence[Tuple[str, Optional[str]]], values: Mapping[str, Any]) -> str:
+    return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in pieces)
+
+
+class PromptTemplate:
+    """
+    A prompt as prefix and suffix format strings.
+
+    :param prefix_args: inputs the prefix depends on (small hashable values such as a method name)
+    :param static: builds the catalog-derived prefix fields from the prefix arguments
+    :param catalogs: names of the catalogs `static` reads, so the prefix is re-rendered when they change
+    """
+
+    def __init__(self, name: str, prefix: str, suffix: str = "", prefix_args: Sequence[str] = (),
+                 static: Optional[Callable[..., Dict[str, Any]]] = None,
+                 catalogs: Callable[..., Sequence[str]] = lambda **_: ()) -> None:
+        self.name = name
+        self.prefix_args = tuple(prefix_args)
+        self._prefix = _compile(prefix)
+        self._suffix = _compile(suffix)
+        self._static = static
+        self._catalogs = catalogs
+        self._prefixes: Dict[Tuple[Any, ...], Tuple[Tuple[int, ...], str]] = {}
+        self._lock = threading.Lock()
+        fields = {field for _, field in self._prefix if field is not None}
+        if not self._static and not fields <= set(self.prefix_args):
+            raise ValueError(f"prompt template {name}: prefix fields {fields} must be prefix arguments")
+
+    def prefix(self, **args: Any) -> str:
+        """
+        The rendered prefix for `args`, reused until one of its catalogs changes.
+        """
+        key = tuple(args[name] for name in self.prefix_args)
+        versions = tuple(catalog_store.version(name) for name in self._catalogs(**args))
+        with self._lock:
+            cached = self._prefixes.get(key)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+        values = dict(args)
+        if self._static is not None:
+            values.update(self._static(**args))
+        text = _render(self._prefix, values)
+        with self._lock:
+            self._prefixes[key] = (versions, text)
+        return text
+
+    def render(self, **inputs: Any) -> Prompt:
+        prefix = self.prefix(**{name: inputs[name] for name in self.prefix_args})
+        return Prompt(self.name, prefix, _render(self._suffix, inputs))
+
+
+def _standard_schema() -> Dict[str, Any]:
+    schema = catalog_store.load(STANDARD_SCHEMA)
+    return {
+        "macro_names": sorted({analysis["AnalysisMethod"] for analysis in schema}),
+        "standard_analysis_schema": schema,
+    }
+
+
+TEMPLATES: Dict[str, PromptTemplate] = {t.name: t for t in [
+    PromptTemplate(
+        "find_stat_method",
+        prefix=("Here is the list of available analysis: {macro_names}.\n"
+                "Please refer to following detailed description: {standard_analysis_schema}\n"
+                "Which (if any) of the available analysis is the user requesting?\n"
+                "Return only the 'AnalysisMethod' of the analysis, no other description.\n"
+                "If the requested analysis is not in the list, return a value of 0."),
+        suffix="Based on user's input: {user_input}",
+        static=_standard_schema,
+        catalogs=lambda: (STANDARD_SCHEMA,),
+    ),
+    PromptTemplate(
+        "set_analysis",
+        prefix="Please refer to following schema for detailed descriptions: {analysis_schema}.",
+        suffix="According to user's request, we will run a {analysis_name} analysis.",
+        prefix_args=("analysis_name",),
+        static=lambda analysis_name: {"analysis_schema": catalog_store.load(analysis_schema_file(analysis_name))},
+        catalogs=lambda analysis_name: (analysis_schema_file(analysis_name),),
+    ),
+    PromptTemplate(
+        "ask_for_info",
+        prefix=("Below are some things to ask the user for in a conversational and natural way. \n"
+                "First you should confirm current input by referring to the current analysis detail below.\n"
+                "Please show all current input in bullet points. Please don't show unspecified parameters.\n"
+                "Second you should ask the user more information.\n"
+                "You should only ask one question at a time even if you don't get all the info "
+                "don't ask as a list! \nDon't greet the user! \nDon't say Hi. \n"
+                "Explain you need to get some info from the user to run the analysis. \n"
+                "Please provide list of options in bullet points if available. \n"
+                "It should be shown in the format of '<variable_name>: <variable_label>' or '<paramcd>: <param>'\n"
+                "Please show <variable_name> and <paramcd> as bold.\n"
+                "Don't repeat that you need get info from the user. \n"
+                "If the ask_for list is empty then thank them and ask how you can help them \n"),
+        suffix=("### current analysis detail: {analysis_detail}\n"
+                "### ask_for list: {key}\n"
+                "### options for {key}: {options}"),
+    ),
+    PromptTemplate(
+        "confirm_info",
+        prefix=("Below are some things to talk to the user for in a conversational and natural way. \n"
+                "You have collected all the info."
+                "Don't ask as a list! \nDon't greet the user! \nDon't say Hi. \n"
+                "Explain you have collected all info needed from the user to run the analysis. \n"
+                "And ask the user to review these parameters and update these parameters if needed. \n"
+                "If no updates needed, we need user's confirmation to proceed. \n"
+                "Ask user to reply 'Yes' if confirm to proceed, and reply 'No' if there's update needed. \n"),
+        suffix="Please return a readable list for current parameter list: {analysis_detail}.",
+    ),
+    PromptTemplate(
+        "run_analysis",
+        prefix=("Below are some things to talk to the user for in a conversational and natural way. \n"
+                "You have collected all the info and the user has confirmed to proceed."
+                "Don't ask as a list! \nDon't greet the user! \nDon't say Hi. \n"
+                "Please tell the user we are running SAS programs to perform the analysis. \n"),
+    ),
+    PromptTemplate(
+        "evaluate_info",
+        prefix=("Which (if any) of the available {key} listed below is the user requesting?\n"
+                "Return only the Endpoint Code or Variable Name value for the {key}.\n"
+                "If the requested option is not in the list, return a value of 0."),
+        suffix=("The user requested the following:\n{text_input}\n"
+                "Here is the list of available {key}\n"
+                "{options}"),
+        prefix_args=("key",),
+    ),
+    PromptTemplate(
+        "evaluate_info_loop",
+        prefix=("Which (if any) of the available {key} listed below is the user requesting?\n"
+                "Return only the paramcd or variable_name value for the {key}.\n"
+                "If the requested option is not in the list, return a value of 0."),
+        suffix=("The user requested the following:\n{text_input}\n"
+                "Here is the list of available {key}\n"
+                "{options}"),
+        prefix_args=("key",),
+    ),
+    PromptTemplate(
+        "evaluate_info_batch",
+        prefix=("For each parameter listed below, which (if any) of the available options is the user requesting?\n"
+                "Return a JSON object with one key per parameter, each set to only the paramcd or variable_name value.\n"
+                "If the requested option is not in the list, set the value to 0."),
+        suffix=("The user requested the following:\n{text_input}\n"
+                "Parameters: {keys}\n"
+                "Here are the lists of available options for each parameter:\n"
+                "{options}"),
+    ),
+    PromptTemplate(
+        "update_info",
+        prefix=("Is the user confirming to execute the analysis or is the user asking to update a parameter?\n"
+                "\nReturn a value of 1 if the user is confirming and would like to execute the analysis.\n"
+                "\nIf the user would like to update a parameter(s), what parameter(s) would the user like to update? "
+                "Only return the name of the parameter(s).\n"
+                "\nElse return a value of 0"),
+        suffix=("The user requested the following:\n{text_input}\n"
+                "\nHere is the list of parameters that can be updated:\n"
+                "{params}"),
+    ),
+]}
+
+
+def render(name: str, **inputs: Any) -> Prompt:
+    """
+    Render template `name`; the prefix comes from the template's cache.
+    """
+    return TEMPLATES[name].render(**inputs)
+
+
+def warm() -> None:
+    """
+    Render the prefixes known ahead of time (one per analysis method and parameter) at startup.
+    """
+    methods = _standard_schema()["macro_names"]
+    params = set()
+    for analysis_name in methods:
+        TEMPLATES["set_analysis"].prefix(analysis_name=analysis_name)
+        schema = catalog_store.load(analysis_schema_file(analysis_name))
+        params.update(schema["properties"]["Parameters"])
+    for template in TEMPLATES.values():
+        if not template.prefix_args:
+            template.prefix()
+    for key in sorted(params):
+        TEMPLATES["evaluate_info"].prefix(key=key)
+        TEMPLATES["evaluate_info_loop"].prefix(key=key)
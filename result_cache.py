@@ -0,0 +1,133 @@
+"""
+Content-addressed cache of analysis results.
+
+An analysis is identified by a hash of its method, its (sorted) parameters,
+the input dataset, the version of the analysis macro and the modification
+stamp of the input data. Identical requests, from any analyst, reuse the PDF
+that was already uploaded instead of re-running SAS. The index lives in SQLite
+with a TTL and an entry limit (least recently used entries go first).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+DB_PATH = os.getenv("RESULT_CACHE_DB_PATH", os.getenv("ADK_DB_PATH", "adk.db"))
+TTL = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+
+
+def key(analysis_method: str, parameters: Mapping[str, Any], dataset: str,
+        macro_version: str, data_stamp: str) -> str:
+    """
+    Canonical SHA-256 of the analysis inputs; parameter order and surrounding whitespace do not matter.
+    """
+    canonical = {
+        "method": analysis_method.strip().upper(),
+        "parameters": sorted((str(k).strip(), str(v).strip()) for k, v in parameters.items()),
+        "dataset": dataset.strip().upper(),
+        "macro_version": macro_version,
+        "data_stamp": data_stamp,
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, db_path: str = DB_PATH, ttl: float = TTL, max_entries: int = MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    result_url TEXT,
+                    analysis_method TEXT,
+                    created_at REAL,
+                    last_hit REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS result_cache_last_hit ON result_cache(last_hit)")
+            self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        Previously uploaded result URL for `cache_key`, or None if missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result_url, created_at FROM result_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE result_cache SET last_hit = ? WHERE cache_key = ?", (now, cache_key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, cache_key: str, result_url: str, analysis_method: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_cache(cache_key, result_url, analysis_method, created_at, last_hit) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cache_key, result_url, analysis_method, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        # Called with the lock held.
+        self._conn.execute("DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM result_cache WHERE cache_key NOT IN "
+            "(SELECT cache_key FROM result_cache ORDER BY last_hit DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM result_cache").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache() -> ResultCache:
+    """
+    The process-wide result cache, created on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
+
+
+def get(cache_key: str) -> Optional[str]:
+    return cache().get(cache_key)
+
+
+def put(cache_key: str, result_url: str, analysis_method: str = "") -> None:
+    cache().put(cache_key, result_url, analysis_method)
+
+
+def stats() -> Dict[str, int]:
+    return cache().stats()
@@ -0,0 +1,240 @@
+"""
+SQLite-backed queue for SAS analysis jobs.
+
+Confirming an analysis enqueues a job and returns its ID immediately; worker
+threads drain the queue by calling `SASConnect.execute_analysis` and record the
+resulting output URL. Queue state lives in SQLite, so queued jobs survive a
+restart. Several processes may share the database: a running job is leased to
+the process that claimed it, which renews the lease while the job runs; a job
+whose lease has expired (its process stopped mid-run) is re-queued, up to
+`SAS_JOB_MAX_ATTEMPTS` runs in all, after which it is marked failed.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+DB_PATH = os.getenv("SAS_JOB_DB_PATH", os.getenv("ADK_DB_PATH", "adk.db"))
+WORKERS = int(os.getenv("SAS_JOB_WORKERS", "2"))
+# Idle workers re-check the table this often, so jobs queued by other processes are picked up too.
+POLL_INTERVAL = float(os.getenv("SAS_JOB_POLL_INTERVAL", "5"))
+# A running job whose owner has not renewed its lease for this long is re-queued
+LEASE = float(os.getenv("SAS_JOB_LEASE", "300"))
+# A job is started at most this many times; one that keeps losing its lease is marked failed
+MAX_ATTEMPTS = int(os.getenv("SAS_JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_COLUMNS = ("job_id", "session_id", "status", "analysis_detail", "result_url", "error",
+            "created_at", "started_at", "finished_at", "owner", "heartbeat_at", "attempts")
+# What the job status endpoint shows; the lease bookkeeping stays internal
+PUBLIC_FIELDS = ("job_id", "status", "result_url", "error", "created_at", "started_at", "finished_at", "position")
+
+
+def _execute_analysis(analysis_detail: Dict[str, Any]) -> str:
+    # Imported lazily: SASConnect needs saspy and a SAS connection, which the web tier does not.
+    import SASConnect
+    return SASConnect.execute_analysis(analysis_detail)
+
+
+class JobQueue:
+    """
+    Persistent job queue with a fixed number of worker threads.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, workers: int = WORKERS,
+                 runner: Callable[[Dict[str, Any]], str] = _execute_analysis, lease: float = LEASE,
+                 max_attempts: int = MAX_ATTEMPTS) -> None:
+        self.workers = workers
+        self.runner = runner
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        self._stopped = threading.Event()
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sas_job (
+                    job_id TEXT PRIMARY KEY,
+                    session_id TEXT,
+                    status TEXT,
+                    analysis_detail TEXT,
+                    result_url TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    heartbeat_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # Databases created before leases were added
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(sas_job)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL"), ("attempts", "INTEGER NOT NULL DEFAULT 0")):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE sas_job ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sas_job_status ON sas_job(status, created_at)")
+            self._conn.commit()
+
+    def start(self) -> None:
+        """
+        Start the worker threads (idempotent).
+        """
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+            self._stopped.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"sas-job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="sas-job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def enqueue(self, analysis_detail: Dict[str, Any], session_id: Optional[str] = None) -> str:
+        """
+        Queue an analysis and return its job ID.
+        """
+        job_id = uuid.uuid4().hex
+        with self._wakeup:
+            self._conn.execute(
+                "INSERT INTO sas_job(job_id, session_id, status, analysis_detail, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, session_id, QUEUED, json.dumps(analysis_detail, default=str), time.time()),
+            )
+            self._conn.commit()
+            self._wakeup.notify()
+        self.start()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the job record (status, result_url, error, timestamps), or None if unknown.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sas_job WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(zip(_COLUMNS, (row[c] for c in _COLUMNS)))
+            if job["status"] == QUEUED:
+                job["position"] = self._conn.execute(
+                    "SELECT count(*) FROM sas_job WHERE status = ? AND created_at < ?", (QUEUED, job["created_at"])
+                ).fetchone()[0]
+        job["analysis_detail"] = json.loads(job["analysis_detail"])
+        return job
+
+    def _requeue_expired(self) -> None:
+        # Called with the lock held. Jobs whose owner stopped renewing the lease never finished; run them
+        # again unless they have used up their attempts (a job that brings its process down every time).
+        now = time.time()
+        expired = "status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+        self._conn.execute(
+            f"UPDATE sas_job SET status = ?, error = ?, finished_at = ? WHERE {expired} AND attempts >= ?",
+            (FAILED, f"The job did not finish in {self.max_attempts} attempts (its worker stopped each time)", now,
+             RUNNING, now - self.lease, self.max_attempts),
+        )
+        self._conn.execute(
+            f"UPDATE sas_job SET status = ?, owner = NULL, started_at = NULL, heartbeat_at = NULL WHERE {expired}",
+            (QUEUED, RUNNING, now - self.lease),
+        )
+        self._conn.commit()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        # Called with the lock held. The status check in the UPDATE keeps two processes
+        # sharing the database from claiming the same job.
+        self._requeue_expired()
+        while True:
+            row = self._conn.execute(
+                "SELECT job_id, analysis_detail FROM sas_job WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            claimed = self._conn.execute(
+                "UPDATE sas_job SET status = ?, owner = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND status = ?",
+                (RUNNING, self.owner, now, now, row["job_id"], QUEUED),
+            ).rowcount
+            self._conn.commit()
+            if claimed:
+                return row
+
+    def _finish(self, job_id: str, status: str, result_url: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            # A job whose lease was lost has been re-queued and belongs to another run; leave it alone
+            self._conn.execute(
+                "UPDATE sas_job SET status = ?, result_url = ?, error = ?, finished_at = ? "
+                "WHERE job_id = ? AND owner = ? AND status = ?",
+                (status, result_url, error, time.time(), job_id, self.owner, RUNNING),
+            )
+            self._conn.commit()
+
+    def _heartbeat(self) -> None:
+        # Renew the lease of this queue's running jobs well before it expires
+        while not self._stopped.wait(self.lease / 3):
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE sas_job SET heartbeat_at = ? WHERE owner = ? AND status = ?",
+                    (time.time(), self.owner, RUNNING),
+                )
+                self._conn.commit()
+
+    def _work(self) -> None:
+        while True:
+            with self._wakeup:
+                row = self._claim()
+                while row is None and not self._stopping:
+                    self._wakeup.wait(POLL_INTERVAL)
+                    row = self._claim()
+                if row is None:
+                    return
+            try:
+                url = self.runner(json.loads(row["analysis_detail"]))
+            except Exception as exc:
+                self._finish(row["job_id"], FAILED, error=str(exc))
+            else:
+                self._finish(row["job_id"], SUCCEEDED, result_url=url)
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def queue() -> JobQueue:
+    """
+    The process-wide job queue, created and started on first use.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+            _queue.start()
+        return _queue
@@ -0,0 +1,316 @@
+"""
+Pool of SAS sessions for SASConnect.
+
+Sessions are created lazily up to a configurable size, checked out for the
+duration of one unit of work (an analysis, a metadata refresh) and checked back
+in. A session whose connection failed during use is discarded and replaced on
+the next checkout; analysis errors (a SAS log with errors, a failed download)
+leave the session usable and it goes back to the pool. Sessions are recycled
+after a maximum number of jobs or idle time, and health-checked before reuse
+when they have been idle for a while.
+
+The backend is pluggable: `SaspyBackend` opens real `saspy.SASsession`s
+(spreading sessions across the `iomhost` list in `sascfg_personal.py`), and
+`FakeSASBackend` stands in for tests and benchmarks without a SAS server.
+"""
+
+import os
+import socket
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+POOL_SIZE = int(os.getenv("SAS_POOL_SIZE", "2"))
+MAX_JOBS = int(os.getenv("SAS_SESSION_MAX_JOBS", "50"))
+MAX_IDLE = float(os.getenv("SAS_SESSION_MAX_IDLE", "900"))
+HEALTH_CHECK_IDLE = float(os.getenv("SAS_SESSION_HEALTH_CHECK_IDLE", "60"))
+CHECKOUT_TIMEOUT = float(os.getenv("SAS_POOL_CHECKOUT_TIMEOUT", "600"))
+
+_HEALTH_MARKER = "BIOSTAT_HEALTH_CHECK"
+
+# Socket and pipe failures (ConnectionError covers broken pipes and resets) and a closed stream
+_CONNECTION_ERRORS = (ConnectionError, EOFError, socket.timeout, socket.herror, socket.gaierror)
+# saspy's exceptions for a lost or refused connection to the SAS server (matched by name: saspy is optional)
+_SASPY_CONNECTION_ERRORS = {
+    "SASIOConnectionError", "SASIOConnectionTerminated",
+    "SASHTTPauthenticateError", "SASHTTPconnectionError", "SASHTTPsubmissionError",
+}
+
+
+def connection_lost(exc: BaseException) -> bool:
+    """
+    Whether `exc` means the session itself can no longer be trusted: socket/pipe errors, saspy's
+    connection exceptions, or an interrupt in the middle of a submit. Other errors, including local
+    file errors such as a missing program file, leave the session usable.
+    """
+    if not isinstance(exc, Exception) or isinstance(exc, _CONNECTION_ERRORS):
+        return True
+    return type(exc).__module__.split(".")[0] == "saspy" and type(exc).__name__ in _SASPY_CONNECTION_ERRORS
+
+_loaded: "weakref.WeakKeyDictionary[Any, Set[str]]" = weakref.WeakKeyDictionary()
+_loaded_lock = threading.Lock()
+
+
+def loaded(session: Any) -> Set[str]:
+    """
+    Keys of what has been loaded into `session` (macros, librefs); lives as long as the session.
+    """
+    with _loaded_lock:
+        state = _loaded.get(session)
+        if state is None:
+            state = _loaded[session] = set()
+        return state
+
+
+_included: "weakref.WeakKeyDictionary[Any, Dict[str, str]]" = weakref.WeakKeyDictionary()
+
+
+def included(session: Any) -> Dict[str, str]:
+    """
+    Macro name -> modification stamp of the file as it was included into `session`. A session keeps
+    running that version until it is recycled, even if the file changes on disk.
+    """
+    with _loaded_lock:
+        state = _included.get(session)
+        if state is None:
+            state = _included[session] = {}
+        return state
+
+
+class SaspyBackend:
+    """
+    Opens `saspy.SASsession`s. With an `iomhost` list in the config, each new
+    session gets the list rotated so sessions start on different hosts.
+    """
+
+    def __init__(self, cfgname: Optional[str] = None) -> None:
+        self.cfgname = cfgname
+        self._created = 0
+        self._hosts = self._iomhosts()
+
+    def _iomhosts(self) -> List[str]:
+        try:
+            import sascfg_personal
+        except ImportError:
+            return []
+        name = self.cfgname or sascfg_personal.SAS_config_names[0]
+        hosts = getattr(sascfg_personal, name, {}).get("iomhost", [])
+        return list(hosts) if isinstance(hosts, (list, tuple)) else []
+
+    def create(self) -> Any:
+        import saspy
+
+        kwargs: Dict[str, Any] = {}
+        if self.cfgname:
+            kwargs["cfgname"] = self.cfgname
+        if self._hosts:
+            i = self._created % len(self._hosts)
+            kwargs["iomhost"] = self._hosts[i:] + self._hosts[:i]
+        self._created += 1
+        return saspy.SASsession(**kwargs)
+
+    def is_alive(self, session: Any) -> bool:
+        try:
+            result = session.submit(f"%put {_HEALTH_MARKER};")
+        except Exception:
+            return False
+        return _HEALTH_MARKER in result.get("LOG", "")
+
+    def close(self, session: Any) -> None:
+        try:
+            session.endsas()
+        except Exception:
+            pass
+
+
+class FakeSASSession:
+    """
+    In-process stand-in for `saspy.SASsession` that records submitted code.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.submitted: List[str] = []
+        self.closed = False
+
+    def submit(self, code: str, results: str = "TEXT", **kwargs: Any) -> Dict[str, str]:
+        if self.closed:
+            raise RuntimeError("SAS session has ended")
+        self.submitted.append(code)
+        if self.latency:
+            time.sleep(self.latency)
+        log = "\n".join(line.split("%put", 1)[1].strip(" ;") for line in code.splitlines() if "%put" in line)
+        return {"LOG": log, "LST": ""}
+
+    def submitLST(self, code: str, **kwargs: Any) -> Dict[str, str]:
+        return self.submit(code)
+
+    def download(self, localfile: str, remotefile: str, **kwargs: Any) -> Dict[str, Any]:
+        return {"Success": True, "LOG": ""}
+
+    def endsas(self) -> None:
+        self.closed = True
+
+
+class FakeSASBackend:
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.sessions: List[FakeSASSession] = []
+
+    def create(self) -> FakeSASSession:
+        session = FakeSASSession(self.latency)
+        self.sessions.append(session)
+        return session
+
+    def is_alive(self, session: FakeSASSession) -> bool:
+        return not session.closed
+
+    def close(self, session: FakeSASSession) -> None:
+        session.endsas()
+
+
+class _Pooled:
+    __slots__ = ("session", "jobs", "created_at", "last_used")
+
+    def __init__(self, session: Any) -> None:
+        self.session = session
+        self.jobs = 0
+        self.created_at = self.last_used = time.monotonic()
+
+
+class SessionPool:
+
+    def __init__(self, backend: Any = None, size: int = POOL_SIZE, max_jobs: int = MAX_JOBS,
+                 max_idle: float = MAX_IDLE, health_check_idle: float = HEALTH_CHECK_IDLE,
+                 checkout_timeout: float = CHECKOUT_TIMEOUT,
+                 on_create: Optional[Callable[[Any], None]] = None) -> None:
+        self.backend = backend if backend is not None else SaspyBackend()
+        # Warm-up hook run once on each new session (e.g. preloading macros)
+        self.on_create = on_create
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_idle = max_idle
+        self.health_check_idle = health_check_idle
+        self.checkout_timeout = checkout_timeout
+        self._idle: List[_Pooled] = []
+        self._open = 0
+        self._available = threading.Condition()
+        self.created = 0
+        self.recycled = 0
+        self.discarded = 0
+
+    def _usable(self, pooled: _Pooled) -> bool:
+        idle = time.monotonic() - pooled.last_used
+        if pooled.jobs >= self.max_jobs or idle >= self.max_idle:
+            with self._available:
+                self.recycled += 1
+            return False
+        if idle >= self.health_check_idle and not self.backend.is_alive(pooled.session):
+            with self._available:
+                self.discarded += 1
+            return False
+        return True
+
+    def _close(self, pooled: _Pooled) -> None:
+        self.backend.close(pooled.session)
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def checkout(self) -> _Pooled:
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self._available:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"No SAS session available within {self.checkout_timeout}s")
+                    self._available.wait(remaining)
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    self._open += 1
+                    pooled = None
+
+            if pooled is None:
+                try:
+                    session = self.backend.create()
+                except Exception:
+                    with self._available:
+                        self._open -= 1
+                        self._available.notify()
+                    raise
+                pooled = _Pooled(session)
+                if self.on_create is not None:
+                    try:
+                        self.on_create(session)
+                    except BaseException as exc:
+                        if connection_lost(exc):
+                            self._close(pooled)
+                            raise
+                        # A failed warm-up (e.g. one macro with a SAS error) only costs the preload: nothing
+                        # it submitted is marked loaded, so each job includes what it needs itself
+                        print(f"SAS session warm-up failed, continuing without preload: {exc}")
+                with self._available:
+                    self.created += 1
+                return pooled
+            if self._usable(pooled):
+                return pooled
+            self._close(pooled)
+
+    def checkin(self, pooled: _Pooled, broken: bool = False) -> None:
+        pooled.jobs += 1
+        pooled.last_used = time.monotonic()
+        if broken:
+            with self._available:
+                self.discarded += 1
+            self._close(pooled)
+            return
+        with self._available:
+            self._idle.append(pooled)
+            self._available.notify()
+
+    @contextmanager
+    def session(self, existing: Any = None) -> Iterator[Any]:
+        """
+        Check out a session for the block (or pass through `existing`, so helpers can share
+        the caller's session). A session whose connection failed in the block is discarded, not reused.
+        """
+        if existing is not None:
+            yield existing
+            return
+        pooled = self.checkout()
+        try:
+            yield pooled.session
+        except BaseException as exc:
+            self.checkin(pooled, broken=connection_lost(exc))
+            raise
+        self.checkin(pooled)
+
+    def close(self) -> None:
+        with self._available:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> Dict[str, int]:
+        with self._available:
+            return {
+                "open": self._open,
+                "idle": len(self._idle),
+                "created": self.created,
+                "recycled": self.recycled,
+                "discarded": self.discarded,
+            }
+
+
+def backend_from_env() -> Any:
+    """
+    `SAS_BACKEND=fake` selects the in-process fake (tests, benchmarks); anything else uses saspy.
+    """
+    if os.getenv("SAS_BACKEND", "saspy").lower() == "fake":
+        return FakeSASBackend(latency=float(os.getenv("SAS_FAKE_LATENCY", "0")))
+    return SaspyBackend(cfgname=os.getenv("SAS_CFGNAME") or None)
@@ -0,0 +1,185 @@
+"""
+Assemble SAS programs for a single submission and parse the resulting log.
+
+An analysis used to cost one round trip per step (%include, libname, macro
+call, %include, upload). `SASProgram` collects the steps, drops includes and
+librefs the session already holds (see `sas_pool.loaded`) and renders one
+program, which is sent with the log-only `submit`. `parse_log` turns the SAS
+log into structured error/warning records so callers can fail the job with the
+actual SAS message instead of guessing from the listing. Every include also
+prints the macro file's modification stamp, so a session knows which version
+of each macro it is running (see `sas_pool.included`).
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Set
+
+# "ERROR: ...", "ERROR 22-322: ...", "WARNING: ...", "WARNING 1-322: ..."
+_MESSAGE_RE = re.compile(r"^(ERROR|WARNING)(?:\s+(\d+-\d+))?:\s?(.*)$")
+# "BIOSTAT_STAMP <name>=<value>" log lines written by `file_stamp`/`dataset_stamp`
+STAMP_MARKER = "BIOSTAT_STAMP"
+
+
+class LogMessage:
+    __slots__ = ("kind", "code", "line", "text")
+
+    def __init__(self, kind: str, code: Optional[str], line: int, text: str) -> None:
+        self.kind = kind
+        self.code = code
+        self.line = line
+        self.text = text
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "code": self.code, "line": self.line, "text": self.text}
+
+    def __str__(self) -> str:
+        code = f" {self.code}" if self.code else ""
+        return f"{self.kind}{code}: {self.text} (log line {self.line})"
+
+
+class SASLog:
+
+    def __init__(self, text: str, messages: List[LogMessage]) -> None:
+        self.text = text
+        self.messages = messages
+
+    @property
+    def errors(self) -> List[LogMessage]:
+        return [m for m in self.messages if m.kind == "ERROR"]
+
+    @property
+    def warnings(self) -> List[LogMessage]:
+        return [m for m in self.messages if m.kind == "WARNING"]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def stamps(self) -> Dict[str, str]:
+        """
+        Stamps printed by the program, by name ("macro:mmrm_macro", "data:ADQSNPIX").
+        """
+        found = {}
+        for line in self.text.splitlines():
+            if line.startswith(STAMP_MARKER):
+                name, _, value = line[len(STAMP_MARKER):].strip().partition("=")
+                found[name] = value.strip()
+        return found
+
+
+class SASProgramError(RuntimeError):
+    """
+    Raised when the SAS log of a submission reports errors.
+    """
+
+    def __init__(self, log: SASLog) -> None:
+        self.log = log
+        super().__init__("; ".join(str(m) for m in log.errors))
+
+
+def parse_log(text: str) -> SASLog:
+    """
+    Collect ERROR/WARNING messages from a SAS log. Indented lines that follow a
+    message are its continuation (SAS wraps long messages that way).
+    """
+    messages: List[LogMessage] = []
+    current: Optional[LogMessage] = None
+    for number, line in enumerate(text.splitlines(), start=1):
+        match = _MESSAGE_RE.match(line)
+        if match:
+            current = LogMessage(match.group(1), match.group(2), number, match.group(3).strip())
+            messages.append(current)
+        elif current is not None and line.startswith(" ") and line.strip():
+            current.text = f"{current.text} {line.strip()}"
+        else:
+            current = None
+    return SASLog(text, messages)
+
+
+def file_stamp(name: str, path: str) -> str:
+    """
+    SAS code printing the "Last Modified" stamp of file `path` as stamp `name`.
+    """
+    return f"""%let _rc = %sysfunc(filename(_sfile, {path}));
+%let _fid = %sysfunc(fopen(&_sfile));
+%put {STAMP_MARKER} {name}=%sysfunc(finfo(&_fid, Last Modified));
+%let _rc = %sysfunc(fclose(&_fid));"""
+
+
+def dataset_stamp(name: str, dataset: str) -> str:
+    """
+    SAS code printing the modification date of `dataset` (libref.member) as stamp `name`.
+    """
+    return f"""%let _dsid = %sysfunc(open({dataset}));
+%put {STAMP_MARKER} {name}=%sysfunc(attrn(&_dsid, MODTE));
+%let _rc = %sysfunc(close(&_dsid));"""
+
+
+def call(macro: str, *args: str, **params: Any) -> str:
+    """
+    Render a macro invocation, e.g. `call("MMRM", "inds=ADQSNPIX", Endpoint="NPITM01S")`.
+    """
+    parts = list(args) + [f"{key}={value}" for key, value in params.items()]
+    return f"%{macro}({','.join(parts)});"
+
+
+class SASProgram:
+    """
+    Builder for one SAS submission.
+
+    `loaded` is the session's set of already loaded macros/librefs; steps for
+    those are skipped, and `mark_loaded()` records the new ones once the
+    program has run cleanly. `included`, when given, receives the stamp of
+    each macro file the program included.
+    """
+
+    def __init__(self, src_path: str, loaded: Optional[Set[str]] = None,
+                 included: Optional[Dict[str, str]] = None) -> None:
+        self.src_path = src_path
+        self.loaded = loaded if loaded is not None else set()
+        self.included = included
+        self._setup: List[str] = []
+        self._body: List[str] = []
+        self._new: List[str] = []
+
+    def _once(self, key: str, code: str) -> "SASProgram":
+        if key not in self.loaded and key not in self._new:
+            self._setup.append(code)
+            self._new.append(key)
+        return self
+
+    def include(self, macro_name: str) -> "SASProgram":
+        path = f"{self.src_path}/{macro_name}.sas"
+        return self._once(f"macro:{macro_name}", f"{file_stamp(f'macro:{macro_name}', path)}\n%include '{path}';")
+
+    def libname(self, libref: str, path: str) -> "SASProgram":
+        return self._once(f"libname:{libref}={path}", f"libname {libref} '{path}';")
+
+    def add(self, code: str) -> "SASProgram":
+        self._body.append(code)
+        return self
+
+    def render(self) -> str:
+        return "\n".join(self._setup + self._body)
+
+    def mark_loaded(self, log: Optional[SASLog] = None) -> None:
+        self.loaded.update(self._new)
+        if self.included is not None and log is not None:
+            stamps = log.stamps
+            for key in self._new:
+                if key.startswith("macro:") and key in stamps:
+                    self.included[key[len("macro:"):]] = stamps[key]
+
+    def submit(self, sas: Any) -> SASLog:
+        """
+        Submit the program (log only, no listing) and raise `SASProgramError` if the log reports errors.
+        """
+        code = self.render()
+        if not code:
+            return SASLog("", [])
+        log = parse_log(sas.submit(code, results="TEXT").get("LOG", ""))
+        if not log.ok:
+            raise SASProgramError(log)
+        self.mark_loaded(log)
+        return log
@@ -0,0 +1,277 @@
+"""
+Per-session chatbot state with LRU + idle-TTL eviction.
+
+Each browser session (cookie or `X-Session-ID` header) gets its own
+`BiostatChatbot`, created lazily on first use. Sessions live in an LRU bounded
+by count and by an approximate size (characters of chat history); sessions idle
+longer than the TTL are evicted first. Evicted sessions are snapshotted to
+SQLite and restored transparently when the same session ID comes back;
+snapshots expire after `SESSION_SNAPSHOT_TTL` and at most
+`SESSION_SNAPSHOT_MAX_COUNT` are kept (oldest go first). Building, restoring
+and snapshotting a chatbot happen outside the manager lock, under a lock for
+that session ID only.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+MAX_SESSIONS = int(os.getenv("SESSION_MAX_COUNT", "200"))
+MAX_CHARS = int(os.getenv("SESSION_MAX_CHARS", "50000000"))
+IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+DB_PATH = os.getenv("SESSION_DB_PATH", os.getenv("ADK_DB_PATH", "adk.db"))
+SNAPSHOT_TTL = float(os.getenv("SESSION_SNAPSHOT_TTL", str(7 * 24 * 3600)))
+SNAPSHOT_MAX_COUNT = int(os.getenv("SESSION_SNAPSHOT_MAX_COUNT", "10000"))
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_session_id(session_id: Optional[str]) -> bool:
+    """
+    Session IDs end up in log and SAS output file names, so only allow a safe character set.
+    """
+    return bool(session_id) and bool(_SESSION_ID_RE.match(session_id))
+
+
+class _Session:
+    __slots__ = ("bot", "last_used", "lock", "users", "size")
+
+    def __init__(self, bot: Any) -> None:
+        self.bot = bot
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # Requests holding or waiting for this session; it is never evicted while in use.
+        self.users = 0
+        self.size = _size(bot)
+
+
+class _IOLock:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # Threads holding or waiting for this lock; the entry is dropped when it reaches zero.
+        self.refs = 0
+
+
+def _size(bot: Any) -> int:
+    return sum(len(m.content) for m in bot.chat_history)
+
+
+class SnapshotStore:
+    """
+    SQLite table of serialized sessions (`bot.snapshot()` output), with a TTL and a row limit.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, ttl: float = SNAPSHOT_TTL, max_count: int = SNAPSHOT_MAX_COUNT) -> None:
+        self.ttl = ttl
+        self.max_count = max_count
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS session_snapshot (
+                    session_id TEXT PRIMARY KEY,
+                    state TEXT,
+                    saved_at REAL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS session_snapshot_saved_at ON session_snapshot(saved_at)")
+            self._conn.commit()
+
+    def save(self, session_id: str, state: Dict[str, Any]) -> None:
+        data = json.dumps(state, default=str)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_snapshot(session_id, state, saved_at) VALUES (?, ?, ?)",
+                (session_id, data, now),
+            )
+            self._expire(now)
+            self._conn.commit()
+
+    def pop(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Remove and return the snapshot for `session_id`, or None if missing or expired.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, saved_at FROM session_snapshot WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM session_snapshot WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+        if time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def _expire(self, now: float) -> None:
+        # Called with the lock held.
+        self._conn.execute("DELETE FROM session_snapshot WHERE saved_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM session_snapshot WHERE session_id NOT IN "
+            "(SELECT session_id FROM session_snapshot ORDER BY saved_at DESC LIMIT ?)",
+            (self.max_count,),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"snapshots": self._conn.execute("SELECT count(*) FROM session_snapshot").fetchone()[0]}
+
+
+class SessionManager:
+    """
+    LRU of live sessions keyed by session ID.
+
+    `factory(session_id)` builds a new chatbot; the chatbot must provide
+    `snapshot()` and `restore(state)` and a `chat_history` of messages.
+    """
+
+    def __init__(self, factory: Callable[[str], Any], max_sessions: int = MAX_SESSIONS,
+                 max_chars: int = MAX_CHARS, idle_ttl: float = IDLE_TTL,
+                 snapshots: Optional[SnapshotStore] = None) -> None:
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.idle_ttl = idle_ttl
+        self.snapshots = snapshots if snapshots is not None else SnapshotStore()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Per-session-ID locks for loading and snapshotting, which happen outside `_lock`
+        self._io: Dict[str, _IOLock] = {}
+        self.created = 0
+        self.restored = 0
+        self.evicted = 0
+
+    def _load(self, session_id: str) -> Tuple[_Session, bool]:
+        # Called without the manager lock, holding the session ID's I/O lock.
+        bot = self.factory(session_id)
+        state = self.snapshots.pop(session_id)
+        if state is not None:
+            bot.restore(state)
+        return _Session(bot), state is not None
+
+    def _io_lock(self, session_id: str) -> _IOLock:
+        # Called with the manager lock held.
+        io = self._io.get(session_id)
+        if io is None:
+            io = self._io[session_id] = _IOLock()
+        io.refs += 1
+        return io
+
+    def _release_io(self, session_id: str, io: _IOLock) -> None:
+        with self._lock:
+            io.refs -= 1
+            if not io.refs:
+                del self._io[session_id]
+
+    def _checkout(self, session_id: str) -> Optional[_Session]:
+        # Called with the manager lock held.
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            session.users += 1
+        return session
+
+    def _open(self, session_id: str) -> _Session:
+        with self._lock:
+            session = self._checkout(session_id)
+            if session is not None:
+                return session
+            io = self._io_lock(session_id)
+        try:
+            # Waits for another request loading this ID, or for its eviction snapshot to be written
+            with io.lock:
+                with self._lock:
+                    session = self._checkout(session_id)
+                if session is None:
+                    session, restored = self._load(session_id)
+                    with self._lock:
+                        if restored:
+                            self.restored += 1
+                        else:
+                            self.created += 1
+                        session.users += 1
+                        self._sessions[session_id] = session
+        finally:
+            self._release_io(session_id, io)
+        return session
+
+    def _evict(self, session_id: str, session: _Session, victims: List[Tuple[str, _Session, _IOLock]]) -> bool:
+        # Called with the manager lock held. The snapshot is written later, outside it, under the
+        # session ID's I/O lock; a request for the ID waits on that lock and then restores the snapshot.
+        io = self._io_lock(session_id)
+        if not io.lock.acquire(blocking=False):
+            # A request for this ID is between lookups; leave the session for the next round
+            io.refs -= 1
+            return False
+        del self._sessions[session_id]
+        self.evicted += 1
+        victims.append((session_id, session, io))
+        return True
+
+    def _enforce_limits(self) -> List[Tuple[str, _Session, _IOLock]]:
+        # Called with the manager lock held; returns the evicted sessions for `_save`.
+        victims: List[Tuple[str, _Session, _IOLock]] = []
+        now = time.monotonic()
+        # Least recently used first; sessions serving a request are skipped.
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used <= self.idle_ttl:
+                break
+            if not session.users:
+                self._evict(session_id, session, victims)
+
+        total = sum(s.size for s in self._sessions.values())
+        for session_id, session in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions and total <= self.max_chars:
+                break
+            if not session.users and self._evict(session_id, session, victims):
+                total -= session.size
+        return victims
+
+    def _save(self, victims: List[Tuple[str, _Session, _IOLock]]) -> None:
+        for session_id, session, io in victims:
+            try:
+                self.snapshots.save(session_id, session.bot.snapshot())
+            finally:
+                io.lock.release()
+                self._release_io(session_id, io)
+
+    @contextmanager
+    def session(self, session_id: str) -> Iterator[Any]:
+        """
+        Yield the chatbot for `session_id`, holding the session's lock for the duration of the request.
+        """
+        session = self._open(session_id)
+        try:
+            with session.lock:
+                yield session.bot
+                session.size = _size(session.bot)
+        finally:
+            with self._lock:
+                session.users -= 1
+                session.last_used = time.monotonic()
+                victims = self._enforce_limits()
+            self._save(victims)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {
+                "live": len(self._sessions),
+                "created": self.created,
+                "restored": self.restored,
+                "evicted": self.evicted,
+            }
+        stats.update(self.snapshots.stats())
+        return stats
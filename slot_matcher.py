@@ -0,0 +1,226 @@
+"""
+Local candidate matcher for parameter (slot) values.
+
+Given the user's message and a parameter such as Endpoint or Population, ranks
+the catalog rows for that parameter by:
+
+1. exact code match (`paramcd`, `variable_name`, `Structure`) as a whole word,
+2. abbreviation match (e.g. "ITT" -> ITTFL, "CFB" -> Change from Baseline),
+   ordered among themselves by label similarity,
+3. IDF-weighted token-set similarity against the row label.
+
+When one candidate clearly wins the slot is resolved without the LLM; when the
+match is ambiguous only the top candidates are offered to the LLM. Words of the
+request itself ("run an analysis", "please change") are not matched, and a
+label match on a single word only counts as clear when that word is nearly the
+whole label ("safety" -> Safety Population Flag, but not "change" -> Change
+from Baseline).
+
+Dataset catalogs (endpoints, variables) are read from `catalog_db`, like every
+other catalog read of the chatbot; covariance structures come from the
+analysis schema.
+"""
+
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import catalog_db
+import catalog_store
+
+# Parameter (lower case) -> (catalog, code field, label field, path to the row list inside the catalog)
+SLOT_CATALOGS: Dict[str, Tuple[str, str, str, Tuple[str, ...]]] = {
+    "endpoint": ("dataset_endpoint_schema.json", "paramcd", "param", ()),
+    "population": ("dataset_population_schema.json", "variable_name", "variable_label", ()),
+    "responsevariable": ("dataset_rspvar_schema.json", "variable_name", "variable_label", ()),
+    "covariate": ("dataset_covariate_schema.json", "variable_name", "variable_label", ()),
+    "covariancematrix": (
+        "mmrm1_analysis_schema.json",
+        "Structure",
+        "Description",
+        ("properties", "Parameters", "CovarianceMatrix", "ValidValues"),
+    ),
+}
+
+TOP_K = int(os.getenv("SLOT_MATCH_TOP_K", "5"))
+MIN_SCORE = float(os.getenv("SLOT_MATCH_MIN_SCORE", "0.4"))
+MIN_MARGIN = float(os.getenv("SLOT_MATCH_MIN_MARGIN", "0.15"))
+SINGLE_TERM_MIN_SCORE = float(os.getenv("SLOT_MATCH_SINGLE_TERM_MIN_SCORE", "0.8"))
+
+EXACT_SCORE = 1.0
+ABBREVIATION_SCORE = 0.8
+# Label similarity adds up to this much to an abbreviation hit, keeping it below an exact code match
+ABBREVIATION_LABEL_WEIGHT = 0.19
+
+_STOPWORDS = frozenset({"a", "an", "and", "as", "at", "by", "for", "from", "in", "of", "on", "or", "the", "to", "with"})
+# Words of the request rather than of a catalog value ("Run an MMRM analysis" must not pick "Analysis Value")
+_INSTRUCTION_WORDS = frozenset({
+    "analysis", "analyses", "analyze", "analyse", "run", "perform", "do", "need", "want", "like", "would", "could",
+    "can", "please", "use", "using", "set", "select", "choose", "pick", "i", "we", "me", "my", "our", "you", "it",
+    "is", "be", "no", "yes", "ok", "let", "lets", "model", "instead",
+})
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(str(text).lower()) if w not in _STOPWORDS and w not in _INSTRUCTION_WORDS]
+
+
+def _stem(word: str) -> str:
+    # Crude prefix stem so "depressed"/"depression" and "agitated"/"agitation" meet.
+    return word[:6]
+
+
+def _terms(text: str) -> Set[str]:
+    return {_stem(w) for w in _words(text) if len(w) > 1}
+
+
+class Candidate(NamedTuple):
+    code: str
+    score: float
+    reason: str
+    row: Any
+    # Label terms the text matched (label matches only)
+    terms: int = 0
+
+
+class SlotMatch(NamedTuple):
+    value: Optional[str]
+    candidates: List[Candidate]
+
+
+class _SlotIndex:
+    """
+    Precomputed per-row code, label terms, initials and IDF weights for one parameter.
+    """
+
+    def __init__(self, rows: List[Any], field: str, label_field: str) -> None:
+        self.rows = []
+        df: Dict[str, int] = {}
+        for row in rows:
+            code = str(row[field])
+            label = str(row.get(label_field) or "")
+            terms = _terms(label)
+            initials = "".join(w[0] for w in _WORD_RE.findall(label.lower()))
+            self.rows.append((code, catalog_store.normalize(code), terms, initials, row))
+            for term in terms:
+                df[term] = df.get(term, 0) + 1
+        n = len(self.rows)
+        # Terms present in every row (e.g. "score", "flag") carry no signal.
+        self.idf = {term: math.log(n / count) for term, count in df.items()}
+
+    def rank(self, text: str) -> List[Candidate]:
+        norm = catalog_store.normalize(text)
+        words = _words(text)
+        terms = {_stem(w) for w in words if len(w) > 1}
+        abbreviations = [w for w in words if len(w) >= 2]
+
+        ranked = []
+        matched_terms: Dict[str, Set[str]] = {}
+        for code, code_norm, label_terms, initials, row in self.rows:
+            pattern = r"(?<![a-z0-9])" + re.escape(code_norm) + r"(?![a-z0-9])"
+            if re.search(pattern, norm):
+                ranked.append(Candidate(code, EXACT_SCORE, "code", row))
+                continue
+            weight = sum(self.idf[t] for t in label_terms)
+            hit = label_terms & terms
+            label_score = sum(self.idf[t] for t in hit) / weight if weight and hit else 0.0
+            if any(
+                (len(w) >= 3 and code_norm.startswith(w)) or (len(initials) > len(w) >= 2 and initials.startswith(w))
+                or w == initials
+                for w in abbreviations
+            ):
+                # "NPI night-time behaviour" abbreviates every NPI item; the label decides between them
+                score = ABBREVIATION_SCORE + ABBREVIATION_LABEL_WEIGHT * label_score
+                ranked.append(Candidate(code, score, "abbreviation", row))
+                continue
+            if label_score > 0:
+                ranked.append(Candidate(code, label_score, "label", row, len(hit)))
+                matched_terms[code] = hit
+
+        # A label match whose matched terms are a strict subset of another
+        # label match's terms ("change from baseline" vs "percent change from
+        # baseline") is explained better by the other row.
+        ranked = [
+            c for c in ranked
+            if c.reason != "label"
+            or not any(matched_terms[c.code] < other for code, other in matched_terms.items() if code != c.code)
+        ]
+        ranked.sort(key=lambda c: c.score, reverse=True)
+        return ranked
+
+
+class SlotMatcher:
+    """
+    Builds a `_SlotIndex` per parameter and catalog version and resolves slot values.
+    Counts slots resolved locally versus slots handed to the LLM.
+    """
+
+    def __init__(self, top_k: int = TOP_K, min_score: float = MIN_SCORE, min_margin: float = MIN_MARGIN,
+                 single_term_min_score: float = SINGLE_TERM_MIN_SCORE) -> None:
+        self.top_k = top_k
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.single_term_min_score = single_term_min_score
+        self._indexes: Dict[str, Tuple[Any, _SlotIndex]] = {}
+        self._lock = threading.Lock()
+        self.resolved = 0
+        self.llm_fallback = 0
+
+    def _slot_index(self, param: str) -> Optional[_SlotIndex]:
+        spec = SLOT_CATALOGS.get(param)
+        if spec is None:
+            return None
+        name, field, label_field, path = spec
+        in_db = name in catalog_db.CATALOGS
+        version = catalog_db.digest(name) if in_db else catalog_store.version(name)
+        cached = self._indexes.get(param)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if in_db:
+            rows = catalog_db.rows(name)
+        else:
+            rows = catalog_store.load(name)
+            for step in path:
+                rows = rows[step]
+        index = _SlotIndex(rows, field, label_field)
+        self._indexes[param] = (version, index)
+        return index
+
+    def rank(self, param: str, text: str) -> List[Candidate]:
+        index = self._slot_index(param.lower())
+        return index.rank(text) if index is not None else []
+
+    def match(self, param: str, text: str) -> SlotMatch:
+        """
+        Return the resolved value (or None) and the top-k candidates for `param`.
+        """
+        ranked = self.rank(param, text)
+        top = ranked[0] if ranked else None
+        runner_up = ranked[1].score if len(ranked) > 1 else 0.0
+        clear = top is not None and top.score >= self.min_score and top.score - runner_up >= self.min_margin
+        if clear and top.reason == "label" and top.terms < 2:
+            clear = top.score >= self.single_term_min_score
+        with self._lock:
+            if clear:
+                self.resolved += 1
+            else:
+                self.llm_fallback += 1
+        return SlotMatch(top.code if clear else None, ranked[:self.top_k])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"resolved": self.resolved, "llm_fallback": self.llm_fallback}
+
+
+matcher = SlotMatcher()
+
+
+def match(param: str, text: str) -> SlotMatch:
+    return matcher.match(param, text)
+
+
+def stats() -> Dict[str, int]:
+    return matcher.stats()
@@ -1,39 +1,78 @@
-import json
-from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-BASE = Path(__file__).resolve().parent.parent / "schema"
+import catalog_db
+import catalog_store
 
+COVARIANCE_STRUCTURES = ("UN", "CS", "AR(1)", "TOEP")
+_COVARIANCE_STRUCTURES = frozenset(catalog_store.normalize(v) for v in COVARIANCE_STRUCTURES)
 
-async def _load_json(name: str) -> List[Dict[str, Any]]:
-    with open(BASE / name, "r") as f:
-        return json.load(f)
 
+# Fields returned by default: the code and its label (dataset_name is only useful when filtering)
+_DEFAULT_FIELDS = {
+    "dataset_endpoint_schema.json": ("paramcd", "param"),
+}
 
-async def list_options(param: str) -> Dict[str, Any]:
-    """Return allowed options for a parameter from local schema catalogs.
+
+def _fields(name: str, fields: str) -> Optional[Tuple[str, ...]]:
+    if fields == "all":
+        return None
+    if fields:
+        return catalog_db.select_columns(name, [f.strip() for f in fields.split(",") if f.strip()])
+    return _DEFAULT_FIELDS.get(name, ("variable_name", "variable_label"))
+
+
+async def list_options(param: str, query: str = "", match: str = "rank", fields: str = "",
+                       dataset_name: str = "", limit: int = catalog_db.PAGE_SIZE, offset: int = 0) -> Dict[str, Any]:
+    """Return one page of allowed options for a parameter from local schema catalogs.
 
     Args:
         param: Parameter name (endpoint, population, responsevariable, covariate, covariancematrix).
+        query: Optional text to search codes and labels for (e.g. "agitation score"); empty lists all options.
+        match: "rank" (best full-text matches first), "prefix" (code/label starts with query)
+            or "like" (code/label contains query).
+        fields: Comma-separated catalog columns to return (default code and label; "all" for every column).
+            Names that are not columns of the catalog are an error.
+        dataset_name: Only options from this dataset (e.g. "ADQSNPIX").
+        limit: Page size.
+        offset: Index of the first option to return (use next_offset from the previous page).
 
     Returns:
-        dict: {"status": "success", "data": <list>} or {"status": "error", "error_message": "..."}.
+        dict: {"status": "success", "data": <list>, "offset": <int>, "next_offset": <int or None>,
+        "more_available": <bool>, "total": <int or None>} or {"status": "error", "error_message": "..."}.
+        "total" is None for searches.
     """
     param = param.lower()
+    limit = max(1, min(int(limit), 200))
+    offset = max(0, int(offset))
     try:
-        if param == "endpoint":
-            data = await _load_json("dataset_endpoint_schema.json")
-        elif param == "population":
-            data = await _load_json("dataset_population_schema.json")
-        elif param == "responsevariable":
-            data = await _load_json("dataset_rspvar_schema.json")
-        elif param == "covariate":
-            data = await _load_json("dataset_covariate_schema.json")
-        elif param == "covariancematrix":
-            data = ["UN", "CS", "AR(1)", "TOEP"]
+        total: Optional[int] = None
+        if param == "covariancematrix":
+            data: List[Any] = list(COVARIANCE_STRUCTURES[offset:offset + limit + 1])
+            total = len(COVARIANCE_STRUCTURES)
+        elif param in catalog_db.PARAM_CATALOGS:
+            name = catalog_db.PARAM_CATALOGS[param]
+            projection = _fields(name, fields)
+            if query:
+                # One extra row tells whether another page exists
+                if match == "rank":
+                    rows = catalog_db.rank(name, query, limit + 1, offset)
+                else:
+                    rows = catalog_db.search(name, query, mode=match, limit=limit + 1, offset=offset)
+                data = [{f: row[f] for f in projection} for row in rows] if projection else rows
+            else:
+                data = catalog_db.rows(name, projection, dataset_name or None, limit=limit + 1, offset=offset)
+                total = catalog_db.count(name, dataset_name or None)
         else:
             return {"status": "error", "error_message": f"Unsupported parameter: {param}"}
-        return {"status": "success", "data": data}
+        more = len(data) > limit
+        return {
+            "status": "success",
+            "data": data[:limit],
+            "offset": offset,
+            "next_offset": offset + limit if more else None,
+            "more_available": more,
+            "total": total,
+        }
     except Exception as exc:
         return {"status": "error", "error_message": str(exc)}
 
@@ -41,6 +80,12 @@ async def list_options(param: str) -> Dict[str, Any]:
 async def validate_param(param: str, value: Any) -> Dict[str, Union[str, bool]]:
     """Validate that a value is in the allowed options list.
 
+    A value is valid when it equals an option's code (e.g. ITTFL) or its label
+    (e.g. "Intent-to-Treat Population Flag"); other fields of the row, such as
+    the dataset name, are not accepted. Matching is case-insensitive, ignores
+    surrounding/repeated whitespace, and is an indexed lookup in the catalog
+    database. Covariance structures match by code only.
+
     Args:
         param: Parameter name.
         value: Value to validate.
@@ -48,16 +93,14 @@ async def validate_param(param: str, value: Any) -> Dict[str, Union[str, bool]]:
     Returns:
         dict: {"status": "success", "data": True/False} or {"status": "error", "error_message": "..."}.
     """
-    options_resp = await list_options(param)
-    if options_resp.get("status") != "success":
-        return options_resp
-    options = options_resp.get("data") or []
-    is_valid = False
-    if isinstance(options, list) and options and isinstance(options[0], dict):
-        for entry in options:
-            if value in entry.values():
-                is_valid = True
-                break
-    else:
-        is_valid = value in options
-    return {"status": "success", "data": is_valid}
+    param = param.lower()
+    try:
+        if param == "covariancematrix":
+            is_valid = catalog_store.normalize(value) in _COVARIANCE_STRUCTURES
+        elif param in catalog_db.PARAM_CATALOGS:
+            is_valid = catalog_db.lookup(param, value, labels=True) is not None
+        else:
+            return {"status": "error", "error_message": f"Unsupported parameter: {param}"}
+        return {"status": "success", "data": is_valid}
+    except Exception as exc:
+        return {"status": "error", "error_message": str(exc)}
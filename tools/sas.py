@@ -1,6 +1,7 @@
 from typing import Any, Dict
 
 import SASConnect
+import async_runtime
 
 
 async def run_sas(analysis_detail: Dict[str, Any]) -> Dict[str, Any]:
@@ -13,7 +14,8 @@ async def run_sas(analysis_detail: Dict[str, Any]) -> Dict[str, Any]:
         dict: {"status": "success", "data": <url>} or {"status": "error", "error_message": "..."}.
     """
     try:
-        url = SASConnect.execute_analysis(analysis_detail)
+        # saspy is blocking; keep the shared event loop free while SAS runs
+        url = await async_runtime.to_thread(SASConnect.execute_analysis, analysis_detail)
         return {"status": "success", "data": url}
     except Exception as exc:
         return {"status": "error", "error_message": str(exc)}
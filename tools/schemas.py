@@ -1,8 +1,6 @@
-import json
-from pathlib import Path
 from typing import Any, Dict
 
-BASE = Path(__file__).resolve().parent.parent / "schema"
+import catalog_store
 
 
 async def load_standard_schema() -> Dict[str, Any]:
@@ -12,8 +10,7 @@ async def load_standard_schema() -> Dict[str, Any]:
         dict: {"status": "success", "data": <schema>} on success, else {"status": "error", "error_message": "..."}.
     """
     try:
-        with open(BASE / "standard_analysis_schema.json", "r") as f:
-            data = json.load(f)
+        data = catalog_store.load("standard_analysis_schema.json")
         return {"status": "success", "data": data}
     except Exception as exc:
         return {"status": "error", "error_message": str(exc)}
@@ -36,8 +33,7 @@ async def load_analysis_schema(method: str) -> Dict[str, Any]:
     }
     try:
         filename = mapping.get(method.upper(), "mmrm1_analysis_schema.json")
-        with open(BASE / filename, "r") as f:
-            data = json.load(f)
+        data = catalog_store.load(filename)
         return {"status": "success", "data": data}
     except Exception as exc:
         return {"status": "error", "error_message": str(exc)}